@@ -0,0 +1,197 @@
+#!/usr/bin/env python3 -B
+"""
+bench.py: time the core of xai.py, binr.py, stats.py on synthetic data
+(c) 2025 Tim Menzies, MIT license
+
+Makes csv files using the usual header conventions (upper case = Num,
+lower case = Sym, +/- = goals) then times load, Data build, disty/distx
+sorts, treeGrow, score1/score2, mixtures and stats.same/rx_sk at each
+size. Results are appended, one JSON object per line, to `out`.
+
+  ./bench.py -r 1000,10000,100000 --all
+  ./bench.py -r 5000 -w 500 --subspace  # tree quality vs speed, wide data
+  ./bench.py -r 1000000 --slots         # binr summaries: old dicts vs slots
+
+Options:
+  -h                help
+  -m missing=0.05   set ratio of "?" in x columns
+  -o out=bench.jsonl  set file for results (JSON lines; if no dir, in tmp)
+  -r rows=1000,10000  set table sizes to try
+  -s seed=1         set random number seed
+  -S Syms=0.25      set ratio of x columns that are symbolic
+  -t tmp=/tmp       set directory for the generated csv files
+  -w wide=200       set number of x columns for --subspace
+  -x xs=8           set number of x columns
+  -y ys=3           set number of y columns   """
+import sys, os, re, io, json, time, random, contextlib, platform, tracemalloc
+from math import sqrt
+from types import SimpleNamespace as obj
+import xai, binr, stats
+
+def coerce(s):
+  try: return int(s)
+  except Exception as _:
+    try: return float(s)
+    except Exception as _: return s.strip()
+
+the = obj(**{m[0]:coerce(m[1]) for m in re.findall(r"(\w+)=(\S+)", __doc__)})
+
+## Synthetic data -------------------------------------------------------------
+def synth(file, rows, xs=8, ys=3, syms=0.25, missing=0.05, seed=1):
+  "Write `rows` rows. Goals are noisy functions of the x columns."
+  R    = random.Random(seed)
+  nsym = round(xs*syms)
+  head = [f"X{j}" for j in range(xs - nsym)] + [f"s{j}" for j in range(nsym)]
+  head += [f"Y{j}{'-+'[j%2]}" for j in range(ys)]
+  w    = [[R.uniform(-1,1) for _ in range(xs)] for _ in range(ys)]
+  with open(file, "w", encoding="utf-8") as f:
+    f.write(",".join(head) + "\n")
+    for start in range(0, rows, 10_000):
+      lines = []
+      for _ in range(min(10_000, rows - start)):
+        x = [R.gauss(0,1) for _ in range(xs)]
+        y = [10 + sum(a*b for a,b in zip(wj,x)) + R.gauss(0,.1) for wj in w]
+        cells = [f"{v:.3f}" for v in x[:xs-nsym]] + ["abcd"[int(abs(v)*2)%4]
+                                                     for v in x[xs-nsym:]]
+        cells = ["?" if R.random() < missing else v for v in cells]
+        lines += [",".join(cells + [f"{v:.3f}" for v in y])]
+      f.write("\n".join(lines) + "\n")
+  return file
+
+## Timings -------------------------------------------------------------------
+def timed(fun, *args):
+  "-> (secs, result). Anything printed by `fun` is swallowed."
+  t = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()): out = fun(*args)
+  return time.perf_counter() - t, out
+
+def ops(file):
+  "Time the core operations on one file. Yields (name, secs)."
+  random.seed(the.seed)
+  t, rows = timed(lambda: list(xai.csv(file)));           yield "xai.csv", t
+  t, data = timed(xai.Data, rows);                         yield "xai.Data", t
+  xai.Data(file)                                           # writes the cache
+  t, _    = timed(lambda: xai.Data(file));                 yield "xai.cached", t
+  t, ys   = timed(lambda: sorted(xai.distys(data)));       yield "xai.disty", t
+  t, _    = timed(lambda: sorted(xai.distxs(data, data.rows[0])))
+  yield "xai.distx", t
+  t, _    = timed(xai.treeGrow, data);                     yield "xai.treeGrow", t
+  t, bd   = timed(binr.Data, rows);                        yield "binr.Data", t
+  t, _    = timed(binr.score1, bd);                        yield "binr.score1", t
+  t, _    = timed(binr.score2, bd);                        yield "binr.score2", t
+  t, _    = timed(binr.mixtures, bd, 100);                 yield "binr.mixtures", t
+  ys      = [float(y) for y in ys]
+  half    = len(ys)//2
+  t, _    = timed(stats.same, ys[:half], ys[half:]);       yield "stats.same", t
+  groups  = {k: ys[k::10] for k in range(10)}
+  t, _    = timed(stats.rx_sk, groups, stats.same);        yield "stats.rx_sk", t
+
+def subspace(file, modes=("all", "sqrt", 10)):
+  "Per xai.the.cols mode, yields (mode, secs to grow, win of the guess)."
+  data = xai.Data(file)
+  ys   = sorted(xai.disty(data, row) for row in data.rows)
+  lo, mid = ys[0], ys[len(ys)//2]
+  for cols in modes:
+    xai.the.cols = cols
+    random.seed(the.seed)
+    rows  = xai.shuffle(data.rows[:])
+    n     = len(rows)//2
+    t, tree = timed(xai.treeGrow, xai.clone(data, rows[:n]))
+    guess = min(xai.flatTop(xai.Flat(tree), rows[n:], xai.the.Check),
+                key=lambda row: xai.disty(data, row))
+    yield cols, t, int(100*(1 - (xai.disty(data, guess) - lo)/(mid - lo)))
+  xai.the.cols = "all"
+
+def outFile(): return the.out if os.path.dirname(the.out) else f"{the.tmp}/{the.out}"
+
+def sizes(): return [the.rows] if type(the.rows) is int else map(int, the.rows.split(","))
+
+def save(out, **d):
+  out.write(json.dumps(dict(**d, python=platform.python_version(), 
+                            when=int(time.time()))) + "\n"); out.flush()
+
+def go__subspace(_=None):
+  "grow trees searching all, sqrt, or 10 columns per node; report win, speedup"
+  with open(outFile(), "a", encoding="utf-8") as out:
+    for n in sizes():
+      file = synth(f"{the.tmp}/bench_{n}x{the.wide}.csv", n, the.wide, the.ys,
+                   the.Syms, the.missing, the.seed)
+      base = None
+      for cols, secs, win in subspace(file):
+        base = base or secs
+        save(out, op="xai.treeGrow", cols=cols, rows=n, xs=the.wide, ys=the.ys, 
+             secs=round(secs,6), win=win, speedup=round(base/secs,2))
+        print(xai.o(cols=cols, rows=n, xs=the.wide, secs=secs, win=win, 
+                    speedup=base/secs))
+
+## binr summaries, before and after __slots__ --------------------------------
+def oldNum(): return binr.obj(it=oldNum, n=0, mu=0, sd=1, m2=0, bins={})
+def oldSym(): return binr.obj(it=oldSym, n=0, has={}, bins={})
+
+def oldAdd(i, item, inc=1): # binr.add, as it was for dict-based summaries
+  if item=="?": return item
+  i.n += inc
+  if   i.it is oldSym: i.has[item] = inc + i.has.get(item,0)
+  elif i.it is oldNum:
+    if inc < 0 and i.n < 2: i.n = i.mu = i.sd = i.m2 = 0
+    else:
+      d     = item - i.mu
+      i.mu += inc * d / i.n
+      i.m2 += inc * d * (item - i.mu)
+      i.sd  = 0 if i.n < 2 else sqrt(max(0,i.m2)/(i.n - 1))
+  return item
+
+def adding(i, add, vals):
+  for v in vals: add(i, v)
+  return i
+
+def kb(fun, n): # -> KB per object made by `fun`
+  tracemalloc.start()
+  b4  = tracemalloc.get_traced_memory()[0]
+  tmp = [fun() for _ in range(n)]
+  kb  = (tracemalloc.get_traced_memory()[0] - b4) / 1024 / n
+  tracemalloc.stop()
+  return kb
+
+def slots(n):
+  "Yields (what, old, new) for add throughput (adds/sec) and KB per column."
+  R  = random.Random(the.seed)
+  xs = [R.gauss(10, 2) for _ in range(n)]
+  ss = [R.choice("abcd") for _ in range(n)]
+  for what, old, new, vals in [("Num", oldNum, binr.Num, xs), 
+                               ("Sym", oldSym, binr.Sym, ss)]:
+    t1, _ = timed(adding, old(), oldAdd, vals)
+    t2, _ = timed(adding, new(), binr.add, vals)
+    yield f"add {what}/sec", n/t1, n/t2
+    yield f"KB/{what} column", kb(old, 10_000), kb(new, 10_000)
+
+def go__slots(_=None):
+  "time binr add, and size its summaries, with dicts (old) and slots (new)"
+  with open(outFile(), "a", encoding="utf-8") as out:
+    for n in sizes():
+      for what, old, new in slots(n):
+        save(out, op="binr.slots", what=what, rows=n, old=old, new=new)
+        print(xai.o(what=what, rows=n, old=old, new=new, ratio=new/old))
+
+def go__all(_=None):
+  "run every operation, at every size; append results to `outFile()`"
+  with open(outFile(), "a", encoding="utf-8") as out:
+    for n in sizes():
+      file = synth(f"{the.tmp}/bench_{n}.csv", n, the.xs, the.ys, the.Syms,
+                   the.missing, the.seed)
+      for op, secs in ops(file):
+        save(out, op=op, rows=n, xs=the.xs, ys=the.ys, syms=the.Syms,
+             missing=the.missing, secs=round(secs,6))
+        print(xai.o(op=op, rows=n, secs=secs))
+
+#-----------------------------------------------------------------------------
+def main(funs, settings):
+  for n, s in enumerate(sys.argv):
+    arg = coerce(sys.argv[n + 1]) if n < len(sys.argv) - 1 else None
+    if fn := funs.get(f"go{s.replace('-', '_')}"): fn(arg)
+    elif s == "-h": print(__doc__)
+    else:
+      for k in settings.__dict__:
+        if k[0] == s.lstrip("-")[0]: settings.__dict__[k] = arg
+
+if __name__ == "__main__": main(vars(), the)
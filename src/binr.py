@@ -29,13 +29,28 @@ OPTIONS
        -r repeats  Number of experimental repeats (int, 20).
        -s seed     Random number seed (int, 42).
        -f file     Path to input CSV file (str, "../data/auto93.csv").
+       -k keep     Rows kept in memory, 0=all, else a sample (int, 0).
+       -t tops     Keep the top bins in a heap (see --top), 0=off (int, 0).
+       -l leaf     Rows per cluster, 0=sqrt(n) (int, 0).
+       -S Some     Rows sampled when picking cluster poles (int, 64).
+       -j jobs     Processes for `pairs` and `nearest`, 0=none (int, 0).
+       -w window   Rows remembered by --stream (int, 256).
+       -P Profile  Profile hot paths: 0=off, 1=print, FILE.json=save (int, 0).
 
 ACTIONS
        --data [f]  Load dataset; print summary of columns and last row.
        --disty [f] Print distance of rows to "best" goal values.
        --distx [f] Print distances based on independent (X) attributes.
+       --near [f]  Check nearest neighbour queries against a full sort.
+       --keep [f]  Test exact summaries, but a sample of rows, when streaming.
+       --mix [f]   Compare batch and one at a time mixtures.
        --inc [f]   Test incremental loading (Welford's) by adding/subbing rows.
        --score [f] Run XAI scoring; guesses next scores via history.
+       --top [f]   Check top bins from the heap against a full sort.
+       --rebin [f] Check score1's cached bin codes; count re-binning per era.
+       --cluster [f] Cluster rows by recursive FastMap bisection.
+       --stream [f] Online scoring of rows from f, f.gz, or stdin (f = -).
+       --sample    Check block sampling against one at a time sampling.
        --random    Test stochastic sampling on generated Eden model.
        --hclimb    Test hill-climbing optimization on generated model.
        --all       Run all defined tests.
@@ -50,6 +65,10 @@ ALGORITHMS
               adapted for the Minkowski metric (p=2). Missing values ("?")
               are assumed to have maximal distance (1.0).
 
+       Clustering (FastMap)
+              Rows are split at the median of their projection onto a line
+              between two distant poles, recursively, till clusters are small.
+
        Sampling
               Normal distributions use Irwin-Hall or Marsaglia polar methods.
               Skewed distributions are modeled using Triangular sampling.
@@ -66,7 +85,13 @@ COPYRIGHT
        
 from math import floor,sqrt,cos,log,exp,pi
 from typing import Any,Iterable
-import fileinput,random,ast,sys,re
+from copy import copy
+from collections import deque, Counter
+try: import numpy # optional: only used by batch `mixtures`, `samples`, `pairs`
+except ImportError: numpy = None
+import fileinput,random,ast,sys,re,os,json,time,heapq
+import multiprocessing,mmap
+from array import array
 rand = random.random
 
 class obj(dict):
@@ -85,25 +110,55 @@ def coerce(s:str) -> Any:
 
 the = obj( **{k:coerce(v) for k,v in re.findall(obj.pat, __doc__)})
 
+# ------------------------------------------------------------------------------
+# Column summaries are built most, so they are classes with `__slots__` (no
+# per-instance dict, no `__getattr__`). `sd` is only worked out (from `m2`)
+# when asked for, and `bins` only made when first used.
+class Slots:
+  "Base for summaries. Prints like `obj`. Equal if the same fields are equal."
+  __slots__ = ("_bins",)
+  def __repr__(i): return "{" + ' '.join(f":{k} {o(v)}" for k,v in i._d()) + "}"
+  def __eq__(i, j): return type(i) is type(j) and i._d() == j._d()
+  __hash__ = None # equal by value, so not hashable (like dict)
+  def _d(i): # fields; "_x" is shown only if there is an `x` property
+    return [("it",i.it)] + [(k.lstrip("_"), getattr(i, k.lstrip("_")))
+             for c in type(i).__mro__ for k in getattr(c,"__slots__",())
+             if hasattr(i, k) and (k[0] != "_" or hasattr(type(i), k[1:]))]
+  @property
+  def bins(i):
+    try: return i._bins
+    except AttributeError: i._bins = {}; return i._bins
+
+class Sym(Slots):
+  "Summarize symbol."
+  __slots__ = ("n","has","at","of","best","_alias")
+  def __init__(i, has:dict=None): i.n, i.has, i._alias = 0, has or {}, None
+
+class Num(Slots):
+  "Summarize numbers."
+  __slots__ = ("n","mu","_sd","m2","at","of","best")
+  def __init__(i, mu=0, sd=1): i.n, i.mu, i._sd, i.m2 = 0, mu, sd, 0
+  @property
+  def sd(i):
+    if i._sd is None: i._sd = 0 if i.n < 2 else sqrt(max(0,i.m2)/(i.n - 1))
+    return i._sd
+  @sd.setter
+  def sd(i, v): i._sd = v
+
+Sym.it, Num.it = Sym, Num
+
 # types, upper case
 QTY  = float | int
 ATOM = QTY | str | bool
 ROW  = list[ATOM]
 ROWS = list[ROW]
-NUM,SYM,TRI, COLS = obj, obj,obj,obj 
+NUM,SYM,TRI, COLS, VP = Num, Sym,obj,obj,obj 
 COL  = NUM | SYM  # not TRO                   
 COLS = list[list[COL]]
 DATA = tuple[ROWS, COLS]             
 
 # ------------------------------------------------------------------------------
 # Constructors, mixed case
-def Sym(has:dict=None) -> SYM: 
-  "Summarize symbol."
-  return obj(it=Sym, n=0, has=has or {}, bins={})
-
-def Num(mu=0, sd=1) -> NUM:
-  "Summarize numbers."
-  return obj(it=Num, n=0, mu=mu, sd=sd, m2=0, bins={})
 
 def Tri(lo=0, mid=0.5, hi=1) -> TRI:  
   "Used to sample from a skewed distribution but (sub/adding not defined)."
@@ -125,13 +180,15 @@ def Cols(names:list[str]) -> COLS:
            x   = [col for col in cols if str(col.of)[-1] not in "+-X"],
            y   = [col for col in cols if str(col.of)[-1] in "+-"])
 
-def Data(rows = None) -> DATA:
-  "Summarize rows into columns."
-  return adds(rows, obj(it=Data, n=0, rows=[], cols=None, _mid=None))
+def Data(rows = None, keep=0) -> DATA:
+  "Summarize rows into columns. If `keep`, only hold a sample of `keep` rows."
+  return adds(rows, obj(it=Data, n=0, rows=[], cols=None, _mid=None, _at=None,
+                        _top=None,
+                        keep=keep))
 
-def clone(data:DATA, rows=None) -> DATA:
-  "Mimic the structure of `data`. Optinally, add some rows."
-  return Data([data.cols.names] + (rows or []))
+def clone(data:DATA, rows=None, keep=0) -> DATA:
+  "Mimic the structure of `data`. Optinally, add some rows (and maybe only `keep` some)."
+  return Data([data.cols.names] + (rows or []), keep)
 
 # ------------------------------------------------------------------------------
 def add(i: NUM | SYM | DATA,   # NOTE: TRI not supported (cant decrement lo,hi) 
@@ -140,22 +197,87 @@ def add(i: NUM | SYM | DATA,   # NOTE: TRI not supported (cant decrement lo,hi)
   "Add or subtract items from columns or data."
   if item=="?": return item
   i.n += inc
-  if   i.it is Sym: i.has[item] = inc + i.has.get(item,0)
+  if   i.it is Sym: 
+    if n := inc + i.has.get(item,0): i.has[item] = n
+    else: i.has.pop(item, None) # so streams only remember what is in the window
+    i._alias = None # see `alias`
   elif i.it is Num:
-    if inc < 0 and i.n < 2: i.n = i.mu = i.sd = i.m2 = 0
+    if inc < 0 and i.n < 1: i.n = i.mu = i.sd = i.m2 = 0
     else:
       d     = item - i.mu
       i.mu += inc * d / i.n
       i.m2 += inc * d * (item - i.mu)
-      i.sd  = 0 if i.n < 2 else sqrt(max(0,i.m2)/(i.n - 1))
+      i._sd = None # see `Num.sd`
   elif i.it is Data:
     if i.cols: 
       i._mid = None
       item = [add(c, item[c.at], inc) for c in i.cols.all] 
-      (i.rows.append if inc > 0 else i.rows.remove)(item)
-    else: i.cols = Cols(item)
+      store(i, item, inc)
+    else: i.cols, i.n = Cols(item), i.n - inc # header is not a row
   return item
 
+def store(data:DATA, row:ROW, inc=1) -> None:
+  "Append `row`, or swap-delete an equal row in O(1). Rows may get reordered."
+  rows, at = data.rows, data._at # `at` maps rows to positions (made on demand)
+  if inc > 0 and data.keep and len(rows) >= data.keep: # reservoir is full
+    if (j := random.randrange(data.n)) < data.keep: # keep with p=keep/n
+      rows[j], data._at = row, None
+    return
+  if inc > 0:
+    rows.append(row)
+    if at is not None: at.setdefault(tuple(row),[]).append(len(rows) - 1)
+    return
+  k, n = tuple(row), len(rows) - 1
+  fresh = (at is not None and n >= 0 and n in at.get(tuple(rows[n]),()) and
+           (k not in at or (at[k][-1] <= n and rows[at[k][-1]] == row)))
+  if not fresh or (k not in at and not data.keep): # rows reordered, or really missing?
+    at = data._at = {}
+    for j,r in enumerate(rows): at.setdefault(tuple(r),[]).append(j)
+  if k not in at: 
+    if data.keep: return # not in the sample; summaries already updated
+    raise ValueError("row not in data")
+  j = at[k].pop()
+  if not at[k]: del at[k]
+  last = rows.pop()
+  if j < n:
+    rows[j] = last
+    js = at[tuple(last)]
+    js[js.index(n)] = j
+
+def merge(i: NUM | SYM | DATA, j: NUM | SYM | DATA, inc=1) -> Any:
+  "New summary of `i` plus `j` (minus, if inc=-1). Nums use Chan et al."
+  if i.it is Data:
+    k = clone(i, keep=i.keep)
+    for a,b,c in zip(k.cols.all, i.cols.all, j.cols.all): 
+      s = merge(b, c, inc)
+      if a.it is Num: a.n, a.mu, a.m2, a.sd = s.n, s.mu, s.m2, s.sd
+      else:           a.n, a.has = s.n, s.has
+    k.n, k.rows = i.n + inc*j.n, i.rows[:]
+    if k.keep and inc > 0: k.rows = sampled([i,j], k.keep)
+    else: [store(k, row, inc) for row in j.rows]
+    return k
+  k = i.it()
+  k.n = i.n + inc*j.n
+  if i.it is Sym:
+    k.has = {v: n for v in i.has | j.has if (n := i.has.get(v,0) + inc*j.has.get(v,0))}
+  elif k.n > 0:
+    if inc > 0:
+      d    = j.mu - i.mu
+      k.mu = i.mu + d*j.n/k.n
+      k.m2 = i.m2 + j.m2 + d*d*i.n*j.n/k.n
+    else:
+      k.mu = (i.n*i.mu - j.n*j.mu) / k.n
+      k.m2 = i.m2 - j.m2 - (j.mu - k.mu)**2 * k.n*j.n/i.n
+    k.sd = 0 if k.n < 2 else sqrt(max(0,k.m2)/(k.n - 1))
+  else: k.n = k.mu = k.sd = k.m2 = 0
+  return k
+
+def sampled(datas:list[DATA], keep:int) -> ROWS:
+  "Sample `keep` rows from `datas`, weighting rows by the `n` each stands for."
+  keys = ((rand() ** (len(d.rows)/d.n), row) # Efraimidis-Spirakis
+          for d in datas if d.rows for row in d.rows)
+  return [row for _,row in heapq.nlargest(keep, keys, key=lambda kr: kr[0])]
+
 def sub(i,item): 
   "Subtract items."
   return add(i,item,-1)
@@ -164,12 +286,104 @@ def adds(items:Iterable = None, it=None ) -> obj: # returns it
   "Load many items into `it` (defeault is `Num()`)."
   it = it or Num()
   if str(items)[-4:]==".csv":
-    with open(items, encoding="utf-8") as f:
-      for line in f:
-        if line: add(it, [coerce(s) for s in line.split(",")])
-  else: [add(it, item) for item in (items or [])]
+    if it.it is Data and not it.cols and not it.keep: return cached(items, it)
+    items = _csv(items)
+  [add(it, item) for item in (items or [])]
   return it
 
+# ------------------------------------------------------------------------------
+# Parsed csv files are kept beside them (as FILE.binr), keyed on the csv's
+# size and mtime. Layout: magic, header length, JSON header (names, column
+# summaries, where each column lives), then one array per column: int64 or
+# float64 (plus a byte mask for "?") or, for anything else (e.g. ints too 
+# big for int64), int32 codes into symbols kept in the header. Stale or 
+# broken caches are ignored and rewritten.
+MAGIC, INT64 = b"BNR1", (-2**63, 2**63)
+
+def cached(file:str, data:DATA) -> DATA:
+  "Load `file` into an empty `data`, via its cache if that is fresh."
+  try: return cacheRead(file, data)
+  except Exception: 
+    data.cols, data.rows, data.n = None, [], 0 # undo any partial read
+    adds(_csv(file), data)
+    try: cacheWrite(file, data)
+    except (OSError, TypeError, ValueError, OverflowError): pass # e.g. read-only directory
+    return data
+
+def _csv(file:str) -> Iterable[ROW]:
+  "Iterate over the rows of a csv file."
+  with open(file, encoding="utf-8") as f:
+    for line in f:
+      if line: yield [coerce(s) for s in line.split(",")]
+
+def cacheRead(file:str, data:DATA) -> DATA:
+  "Restore rows and column summaries from the cache. Raises if stale."
+  st = os.stat(file)
+  with open(f"{file}.binr", "rb") as f:
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      assert mm[:4] == MAGIC
+      n    = int.from_bytes(mm[4:12], "little")
+      head = json.loads(mm[12:12+n])
+      assert head["key"] == [st.st_size, st.st_mtime_ns]
+      base = 12 + n + (-(12+n) % 8)
+      cols = [_cacheCol(mm, base, head["rows"], c) for c in head["cols"]]
+  add(data, head["names"])
+  for col,stat in zip(data.cols.all, head["stats"]):
+    if col.it is Num: col.n, col.mu, col.sd, col.m2 = stat
+    else: col.n, col.has = stat[0], {k:v for k,v in stat[1]}
+  data.rows, data.n = list(map(list, zip(*cols))), head["rows"]
+  return data
+
+def cacheWrite(file:str, data:DATA) -> None:
+  "Write the cache for `file`."
+  stats = [[c.n, c.mu, c.sd, c.m2] if c.it is Num else [c.n, list(c.has.items())]
+           for c in data.cols.all]
+  rows, n, cols, blobs = data.rows, len(data.rows), [], bytearray()
+  if any(len(row) != len(data.cols.names) for row in rows): 
+    raise ValueError("ragged rows")
+  def put(b): # -> offset of `b` in the body
+    at, b = len(blobs), bytes(b)
+    blobs.extend(b + bytes(-len(b) % 8))
+    return at
+  for j in range(len(data.cols.names)):
+    xs   = [row[j] for row in rows]
+    ok   = [x for x in xs if x != "?"]
+    kind = _cacheKind(ok)
+    if kind == "s":
+      codes = {}
+      for x in ok: codes.setdefault((type(x),x), len(codes))
+      at = put(array("i", [-1 if x=="?" else codes[(type(x),x)] for x in xs]))
+      cols += [dict(kind=kind, at=at, mask=None, syms=[x for _,x in codes])]
+    else:
+      at   = put(array(kind, [0 if x=="?" else x for x in xs]))
+      mask = None if len(ok) == n else put(bytes(x=="?" for x in xs))
+      cols += [dict(kind=kind, at=at, mask=mask, syms=None)]
+  st   = os.stat(file)
+  head = json.dumps(dict(key=[st.st_size, st.st_mtime_ns], rows=n, cols=cols,
+                         names=data.cols.names, stats=stats)).encode()
+  tmp  = f"{file}.binr.{os.getpid()}" # written aside, then renamed: no half caches
+  with open(tmp, "wb") as f:
+    f.write(MAGIC + len(head).to_bytes(8, "little") + head)
+    f.write(bytes(-(12 + len(head)) % 8) + blobs)
+  os.replace(tmp, f"{file}.binr")
+
+def _cacheCol(mm, base:int, n:int, c:dict) -> list:
+  "Decode one column's cells from its typed array (and mask)."
+  kind, size = ("i",4) if c["kind"] == "s" else (c["kind"], 8)
+  at = base + c["at"]
+  xs = memoryview(mm)[at : at + n*size].cast(kind).tolist()
+  if c["kind"] == "s": return list(map((c["syms"] + ["?"]).__getitem__, xs))
+  if c["mask"] is not None:
+    for j,m in enumerate(mm[base + c["mask"] : base + c["mask"] + n]):
+      if m: xs[j] = "?"
+  return xs
+
+def _cacheKind(ok:list) -> str:
+  "Array type for a column's known values: int64, float64, or symbol codes."
+  if all(type(x) is int and INT64[0] <= x < INT64[1] for x in ok): return "q"
+  if all(type(x) is float for x in ok): return "d"
+  return "s"
+
 # ------------------------------------------------------------------------------
 def sample(i: TRI | SYM | NUM | list) -> list:
   "Sample a value from a TRI / Num / Sym / Data summary."
@@ -180,16 +394,97 @@ def sample(i: TRI | SYM | NUM | list) -> list:
     u, v = rand(), rand()
     return i.lo + (i.hi - i.lo) * (min(u, v) + p * abs(u - v))
   if i.it is Sym:
-    r = rand() * i.n
-    for x, count in i.has.items():
-      r -= count
-      if r <= 0: return x
-    return x # should never get here.
+    xs, p, other = alias(i)
+    j = int(rand() * len(xs))
+    return xs[j] if rand() < p[j] else xs[other[j]]
+
+def alias(i:SYM) -> tuple[list,list,list]:
+  "Walker/Vose tables: pick slot `j`, then `xs[j]` (prob `p[j]`) or `xs[other[j]]`."
+  if i._alias is None: # reset by `add`
+    xs    = [x for x,n in i.has.items() if n > 0]
+    p     = [i.has[x] * len(xs) / i.n for x in xs]
+    other = list(range(len(xs)))
+    small, big = [j for j,q in enumerate(p) if q < 1], [j for j,q in enumerate(p) if q >= 1]
+    while small and big:
+      s, b = small.pop(), big.pop()
+      other[s] = b
+      p[b] -= 1 - p[s]
+      (small if p[b] < 1 else big).append(b)
+    for j in small + big: p[j] = 1 # left overs (rounding errors) 
+    i._alias = (xs, p, other)
+  return i._alias
+
+def samples(cols:list, n:int, polar=False) -> ROWS:
+  "`n` rows of `sample(cols)`. With numpy, one column (of all `n` rows) at a time."
+  if numpy is None:
+    if not polar: return [sample(cols) for _ in range(n)]
+    return [[marsagliaPolar(c.mu, c.sd) if c.it is Num else sample(c) for c in cols]
+            for _ in range(n)]
+  R = numpy.random.default_rng(random.getrandbits(64))
+  def one(c):
+    if c.it is Num: return (marsaglias if polar else irwinHalls)(R,c,n)
+    if c.it is Tri: return tris(R, c, n)
+    xs, p, other = (numpy.array(z, dtype=object if k==0 else None)
+                    for k,z in enumerate(alias(c)))
+    j = R.integers(len(xs), size=n)
+    return xs[numpy.where(R.random(n) < p[j], j, other[j])]
+  return [list(row) for row in zip(*(one(c).tolist() for c in cols))]
+
+def irwinHalls(R, i:NUM, n:int):
+  "`n` of `irwinHall3(i.mu, i.sd)`, from numpy generator `R`."
+  return i.mu + i.sd * 2.0 * (R.random((3,n)).sum(axis=0) - 1.5)
+
+def marsaglias(R, i:NUM, n:int):
+  "`n` of `marsagliaPolar(i.mu, i.sd)`, from numpy generator `R`."
+  out = numpy.empty(0)
+  while len(out) < n: # about 79% of pairs are kept
+    u,v = 2*R.random((2, int(1.3*(n - len(out))) + 8)) - 1
+    s   = u*u + v*v
+    ok  = (0 < s) & (s < 1)
+    out = numpy.concatenate([out, u[ok]*numpy.sqrt(-2*numpy.log(s[ok])/s[ok])])
+  return i.mu + i.sd*out[:n]
+
+def tris(R, i:TRI, n:int):
+  "`n` samples of `i`, from numpy generator `R`."
+  p   = (i.mid - i.lo) / (i.hi - i.lo + 1e-32)
+  u,v = R.random((2,n))
+  return i.lo + (i.hi - i.lo) * (numpy.minimum(u, v) + p * numpy.abs(u - v))
 
 def mixtures(data: list[COL], np=100) -> Data:
   "Return `n` samples nonparametrically: add the delta between two items to a third."
-  any = lambda: random.choice(data.rows)
-  return [mixture(data, any(), any(), any()) for _ in range(np)]
+  if numpy is None:
+    any = lambda: random.choice(data.rows)
+    return [mixture(data, any(), any(), any()) for _ in range(np)]
+  return mixtures1(data, np, numpy.random.default_rng(random.getrandbits(64)))
+
+def mixtures1(data:DATA, n:int, R) -> ROWS:
+  "`mixture`, for `n` rows at once, via numpy generator `R`."
+  m   = len(data.cols.all)
+  ks  = R.integers(len(data.rows), size=(3,n)) # donors a,b,c for each child
+  all = numpy.array(data.rows, dtype=object)
+  a,b,c = all[ks]
+  mix = R.random((n,m)) < the.CF
+  mix[numpy.arange(n), R.integers(m, size=n)] = False # keep one cell of `a`
+  out = numpy.where(mix, numpy.where(R.random((n,m)) < 0.5, b, c), a)
+  if js := [col.at for col in data.cols.all if col.it is Num]: # extrapolate
+    nums   = [data.cols.all[j] for j in js]
+    A,B,C  = _floats(all[:,js])[ks] # "?" or symbols -> nan
+    lo, hi = (numpy.array([col.mu + k*3*col.sd for col in nums]) for k in (-1,1))
+    v      = A + the.F*(B - C)
+    with numpy.errstate(invalid="ignore", divide="ignore"): # sd=0: no wrap
+      v = numpy.where(v < lo, hi - (lo - v) % (hi - lo),
+          numpy.where(v > hi, lo + (v - hi) % (hi - lo), v))
+    ok  = mix[:,js] & ~numpy.isnan(v)
+    tmp = out[:,js]
+    tmp[ok] = v[ok]
+    out[:,js] = tmp
+  return out.tolist()
+
+def _floats(x): 
+  "Object array to floats. Anything not an int or float becomes nan."
+  nan = float("nan")
+  return numpy.frompyfunc(lambda z: z if type(z) in [float,int] else nan, 1, 1
+                          )(x).astype(float)
 
 def mixture(data:DATA, a:ROW, b:ROW, c:ROW) -> ROW:
   "Mutate `a` by mixing items from `b,c`."
@@ -295,43 +590,376 @@ def _aha(col:COL, a:ATOM, b:ATOM) -> float:
 #              rest=rest)
 
 # ------------------------------------------------------------------------------
-def scoreGet(model, use, row:ROW) -> ROW:
-  "Sum the score of the bins used by `row`."
+# Vantage point trees. Each node keeps a row `vp` and the distance range
+# [lo,hi] from `vp` to its inner and outer kids, so queries skip any kid that
+# the triangle inequality says is too far. `distx` obeys that inequality,
+# even with "?" (per column, Aha's guess for "?" is never closer than the
+# known value). Nodes measure distance with the x columns as they were at
+# build time. Otherwise, inserts would move the norms and stale the ranges.
+def Vp(data:DATA, rows=None, leaf=16) -> VP:
+  "Index `rows` (default: all of `data`) for nearest neighbour queries."
+  rows = data.rows if rows is None else rows
+  i = obj(it=Vp, n=len(rows), leaf=leaf, calls=0,
+          data=obj(cols=obj(x=[copy(col) for col in data.cols.x])))
+  i.root = _vp(i, list(rows))
+  return i
+
+def _vp(i:VP, rows:ROWS) -> obj:
+  "Split `rows` at the median distance to a random vantage point."
+  if len(rows) <= i.leaf: return obj(rows=rows)
+  vp = rows.pop(random.randrange(len(rows)))
+  ds = [distx(i.data, vp, row) for row in rows]
+  js = sorted(range(len(rows)), key=ds.__getitem__)
+  m  = len(js) // 2
+  return obj(vp=vp, mu=ds[js[m-1]],
+             lo=[ds[js[0]], ds[js[m]]], hi=[ds[js[m-1]], ds[js[-1]]],
+             kids=[_vp(i, [rows[j] for j in js[:m]]),
+                   _vp(i, [rows[j] for j in js[m:]])])
+
+def vpAdd(i:VP, row:ROW) -> ROW:
+  "Insert `row`. Leaves that outgrow `i.leaf` are split."
+  node, up = i.root, None
+  while "vp" in node:
+    d = distx(i.data, node.vp, row)
+    k = int(d > node.mu)
+    node.lo[k], node.hi[k] = min(node.lo[k], d), max(node.hi[k], d)
+    up, node = (node, k), node.kids[k]
+  node.rows.append(row)
+  i.n += 1
+  if len(node.rows) > i.leaf:
+    if up: up[0].kids[up[1]] = _vp(i, node.rows)
+    else:  i.root = _vp(i, node.rows)
+  return row
+
+def vpNear(i:VP, row:ROW, k=1, r=1e32) -> list[tuple[float,ROW]]:
+  "The `k` (None = any number) rows nearest `row`, within `r`. As (d,row), nearest first."
+  heap, seq = [], 0  # max-heap of (-d, seq, row)
+  def far(): return -heap[0][0] if k and len(heap) == k else r
+  def keep(d, one):
+    nonlocal seq
+    i.calls += 1
+    if d > far(): return
+    seq += 1
+    if k and len(heap) == k: heapq.heapreplace(heap, (-d, seq, one))
+    else: heapq.heappush(heap, (-d, seq, one))
+  def visit(node):
+    if "rows" in node:
+      for one in node.rows: keep(distx(i.data, row, one), one)
+      return
+    d = distx(i.data, row, node.vp)
+    keep(d, node.vp)
+    for c in ((0,1) if d <= node.mu else (1,0)):
+      if node.lo[c] - far() <= d <= node.hi[c] + far(): visit(node.kids[c])
+  visit(i.root)
+  return [(-d, one) for d,_,one in sorted(heap, reverse=True)]
+
+# ------------------------------------------------------------------------------
+# All pairs `distx`, a `tile` by `tile` block at a time (so memory is tile^2,
+# not n^2, per step). With numpy, rows become a matrix of `norm`ed cells (NaN
+# for "?"; symbols become codes) and each block is one pass per column (the
+# `_aha` rules, vectorized). With `the.jobs`, blocks are done by other
+# processes. Results are float32; `pairs(...,out=FILE)` writes them to a
+# memory-mapped .npy file, for n too big for RAM. `nearest` just streams the
+# `k` closest rows, per row, without keeping the matrix.
+def pairs(data:DATA, rows=None, out=None, tile=256):
+  "n*n distances between `rows`. Without numpy, a list of lists."
+  rows = data.rows if rows is None else rows
+  if numpy is None:
+    return [[distx(data, r1, r2) for r2 in rows] for r1 in rows]
+  n   = len(rows)
+  got = (numpy.lib.format.open_memmap(out, mode="w+", dtype=numpy.float32, 
+                                      shape=(n,n)) if out else
+         numpy.empty((n,n), dtype=numpy.float32))
+  todo = [(i, j) for i in range(0, n, tile) for j in range(i, n, tile)]
+  for i,j,d in _pairsMap(data, rows, _pairsTile, todo, tile):
+    got[i:i+len(d), j:j+d.shape[1]] = d
+    got[j:j+d.shape[1], i:i+len(d)] = d.T # distx is symmetric
+  if out: got.flush()
+  return got
+
+def nearest(data:DATA, rows=None, k=5, tile=256) -> Iterable[list[tuple[float,ROW]]]:
+  "Per row of `rows` (in order): its `k` nearest other rows, as (d,row), nearest first."
+  rows = data.rows if rows is None else rows
+  if numpy is None:
+    for r1 in rows:
+      yield heapq.nsmallest(k, ((distx(data, r1, r2), r2) for r2 in rows if r2 is not r1),
+                            key=lambda z: z[0])
+    return
+  todo = [(i, k) for i in range(0, len(rows), tile)]
+  for i,ds,js in _pairsMap(data, rows, _pairsNear, todo, tile):
+    for d,j in zip(ds.tolist(), js.tolist()):
+      yield [(d1, rows[j1]) for d1,j1 in zip(d,j)]
+
+def _pairsMap(data, rows, fun, todo, tile):
+  "Run `fun` over `todo`, here or (if `the.jobs`) in a pool. In order."
+  x   = _cells(data, rows)
+  num = numpy.array([c.it is Num for c in data.cols.x])
+  if the.jobs and len(todo) > 1 and not multiprocessing.current_process().daemon:
+    with multiprocessing.Pool(the.jobs, _pairsInit, (x, num, the.p, tile)) as pool:
+      yield from pool.imap(fun, todo)
+  else:
+    _pairsInit(x, num, the.p, tile)
+    yield from map(fun, todo)
+
+_PAIRS = None # per process: cells, which columns are Num, p, tile
+
+def _pairsInit(x, num, p, tile):
+  global _PAIRS
+  _PAIRS = (x, num, p, tile)
+
+def _pairsTile(ij): # -> i, j, block of distances
+  x, num, p, tile = _PAIRS
+  i, j = ij
+  return i, j, _ahas(x[i:i+tile], x[j:j+tile], num, p).astype(numpy.float32)
+
+def _pairsNear(ik): # -> i, and for rows i..i+tile, the k nearest (distances, indexes)
+  x, num, p, tile = _PAIRS
+  i, k = ik
+  u  = x[i:i+tile]
+  k  = min(k, len(x) - 1)
+  ds = numpy.full((len(u), 0), numpy.inf); js = numpy.zeros((len(u), 0), dtype=int)
+  for j in range(0, len(x), tile):
+    d = _ahas(u, x[j:j+tile], num, p)
+    a  = numpy.arange(len(u)) + i - j # where each row of `u` is, in this block
+    ok = (0 <= a) & (a < d.shape[1])
+    d[ok, a[ok]] = numpy.inf          # no row is its own neighbor
+    ds = numpy.hstack([ds, d])
+    js = numpy.hstack([js, numpy.broadcast_to(numpy.arange(j, j + d.shape[1]), d.shape)])
+    if ds.shape[1] > k:
+      keep = numpy.argpartition(ds, max(k - 1, 0), axis=1)[:, :k]
+      ds, js = numpy.take_along_axis(ds, keep, 1), numpy.take_along_axis(js, keep, 1)
+  order = numpy.argsort(ds, axis=1, kind="stable")
+  return i, numpy.take_along_axis(ds, order, 1), numpy.take_along_axis(js, order, 1)
+
+def _cells(data:DATA, rows:ROWS, codes=None):
+  """Rows as a numpy matrix of `norm`ed x cells (NaN for '?'; symbols become codes).
+  To matrix rows in batches, share `codes` (so a symbol gets one code in all)."""
+  codes = {} if codes is None else codes
+  out   = numpy.full((len(rows), len(data.cols.x)), numpy.nan)
+  for j,col in enumerate(data.cols.x):
+    vals = [row[col.at] for row in rows]
+    ok   = numpy.array([v != "?" for v in vals], dtype=bool)
+    if col.it is Sym:
+      has = codes.setdefault(col.at, {})
+      out[ok,j] = [has.setdefault(v, len(has)) for v in vals if v != "?"]
+    elif ok.any():
+      z = (numpy.array([v for v in vals if v != "?"], dtype=float) - col.mu)/(col.sd + 1e-32)
+      with numpy.errstate(over="ignore"): out[ok,j] = 1/(1 + numpy.exp(-1.7*z))
+  return out
+
+def _ahas(u, v, num, p):
+  "`distx` of each row of `u` to each row of `v` (`_aha` per column, then `dist`)."
+  out = numpy.zeros((len(u), len(v)))
+  for c in range(u.shape[1]):
+    a, b   = u[:, c, None], v[None, :, c]
+    na, nb = numpy.isnan(a), numpy.isnan(b)
+    if num[c]:
+      a1 = numpy.where(na, numpy.where(b > 0.5, 0., 1.), a)
+      b1 = numpy.where(nb, numpy.where(a1 > 0.5, 0., 1.), b)
+      d  = numpy.abs(a1 - b1)
+    else: d = (a != b).astype(float) # NaN != anything
+    out += numpy.where(na & nb, 1., d) ** p
+  return (out / u.shape[1]) ** (1/p)
+
+# ------------------------------------------------------------------------------
+# Clustering by recursive bisection (FastMap). At each node, two far apart
+# poles `a,b` are found in a sample of `the.Some` rows. Then every row is
+# projected onto the line a..b (cosine rule, so 2 `distx` per row, done in
+# batches) and the rows split at the median. So each level is O(n) and the
+# whole tree is O(n log n). Leaves are `clone`d summaries of their rows.
+def Cluster(data:DATA, rows=None, leaf=None, batch=4096) -> obj:
+  "Tree of `rows`: nodes have poles `a,b` and two `kids`; leaves have `data`."
+  rows = data.rows if rows is None else rows
+  leaf = leaf or the.leaf or int(sqrt(len(rows)))
+  D    = _distxTo(data, rows, batch)
+  def grow(js):
+    if len(js) > max(leaf, 1):
+      some = random.sample(list(js), min(the.Some, len(js)))
+      a    = some[_far(D(some, random.choice(some)))]
+      b    = some[_far(D(some, a))]
+      if (c := distx(data, rows[a], rows[b])) > 0: 
+        xs = _project(D(js, a), D(js, b), c)
+        lo, hi = _halves(js, xs)
+        return obj(it=Cluster, n=len(js), a=rows[a], b=rows[b], c=c,
+                   kids=[grow(lo), grow(hi)])
+    return obj(it=Cluster, n=len(js), data=clone(data, [rows[j] for j in js]))
+  return grow(range(len(rows)) if numpy is None else numpy.arange(len(rows)))
+
+def _distxTo(data:DATA, rows:ROWS, batch:int):
+  "-> D(js,k): `distx` from `rows[j]` (for j in `js`) to `rows[k]`, in batches."
+  if numpy is None: 
+    return lambda js,k: [distx(data, rows[j], rows[k]) for j in js]
+  codes = {} # one code per symbol, in all batches
+  x     = numpy.vstack([_cells(data, rows[i:i+batch], codes) 
+                        for i in range(0, len(rows), batch)] or
+                       [numpy.empty((0, len(data.cols.x)))])
+  num   = numpy.array([c.it is Num for c in data.cols.x])
+  return lambda js,k: numpy.concatenate(
+           [_ahas(x[js[i:i+batch]], x[[k]], num, the.p)[:,0]
+            for i in range(0, len(js), batch)] or [numpy.empty(0)])
+
+def _far(ds): # index of the largest distance
+  return max(range(len(ds)), key=ds.__getitem__) if numpy is None else int(numpy.argmax(ds))
+
+def _project(da, db, c): # where each row falls on the line between poles, distance `c` apart
+  if numpy is None: return [(a*a + c*c - b*b)/(2*c) for a,b in zip(da, db)]
+  return (da*da + c*c - db*db)/(2*c)
+
+def _halves(js, xs): # rows `js` split at the median of `xs`
+  m = len(js)//2
+  if numpy is None:
+    js = [j for _,j in sorted(zip(xs, js))]
+    return js[:m], js[m:]
+  order = numpy.argpartition(xs, m)
+  return js[order[:m]], js[order[m:]]
+
+def leaves(tree:obj) -> Iterable[DATA]:
+  "The `data` at the leaves of a `Cluster` tree, left to right."
+  if "data" in tree: yield tree.data
+  else:
+    for kid in tree.kids: yield from leaves(kid)
+
+# ------------------------------------------------------------------------------
+# `top` wants a few of the best bins, but each `scorePut` only changes one bin
+# per x column. So if `model._top` is a `Tops`, bins live in an indexed max-heap
+# (`pos` finds a bin's place). Changed bins are noted (once each) in `dirty`,
+# and re-sifted when next we ask for the `tops`. Ties are broken as `sorted`
+# would: by column, then by when the bin was made.
+def Tops(data:DATA) -> obj:
+  "Indexed max-heap of the bins of `data`'s x columns, keyed on `want`."
+  return obj(it=Tops, heap=[], pos={}, dirty={}, seq=0,
+             col={x.at: j for j,x in enumerate(data.cols.x)})
+
+def topsPut(t:obj, slot:NUM) -> None:
+  "Note that `slot` is new, or that its `want` changed."
+  t.dirty[id(slot)] = slot
+
+def topsPop(t:obj, slot:NUM) -> None:
+  "Forget `slot`."
+  t.dirty.pop(id(slot), None)
+  if (j := t.pos.pop(id(slot), None)) is None: return
+  last = t.heap.pop()
+  if j < len(t.heap):
+    t.heap[j] = last
+    _topsDown(t, _topsUp(t, j))
+
+def _topsSync(t): # re-sift the changed bins
+  for slot in t.dirty.values():
+    if (j := t.pos.get(id(slot))) is None:
+      t.seq += 1
+      j = t.pos[id(slot)] = len(t.heap)
+      t.heap += [[0, t.col[slot.at], t.seq, slot]] # seq is unique: slots never compared
+    t.heap[j][0] = want(slot)
+    _topsDown(t, _topsUp(t, j))
+  t.dirty = {}
+
+def _topsUp(t, j): # move the hole at `j` up, till its entry fits
+  h, pos, e = t.heap, t.pos, t.heap[j]
+  while j and e > h[(j - 1) // 2]:
+    h[j] = h[(j - 1) // 2]; pos[id(h[j][3])] = j; j = (j - 1) // 2
+  h[j] = e; pos[id(e[3])] = j
+  return j
+
+def _topsDown(t, j): # move the hole at `j` down, till its entry fits
+  h, pos, e, n = t.heap, t.pos, t.heap[j], len(t.heap)
+  while (k := 2*j + 1) < n:
+    if k + 1 < n and h[k+1] > h[k]: k += 1
+    if e >= h[k]: break
+    h[j] = h[k]; pos[id(h[j][3])] = j; j = k
+  h[j] = e; pos[id(e[3])] = j
+
+def tops(t:obj, k:int) -> list[NUM]:
+  "The `k` best slots, best first. Walks `k` of the heap, not all of it."
+  _topsSync(t)
+  h, out = t.heap, []
+  todo = [([-v for v in h[0][:3]], 0)] if h else []
+  while todo and len(out) < k:
+    _, j = heapq.heappop(todo)
+    out += [h[j][3]]
+    for c in (2*j + 1, 2*j + 2):
+      if c < len(h): heapq.heappush(todo, ([-v for v in h[c][:3]], c))
+  return out
+
+# ------------------------------------------------------------------------------
+# Each era, `score1` freezes its model while it picks from the next rows. So
+# there, each cell `use` reads is binned once, up front. A cell binned last
+# era keeps its code if it is still well inside that bin (its edges, where
+# `norm` crosses k/bins, drift with `mu` and `sd`). Counts per era: `rebins`.
+def Codes() -> obj:
+  "Bin codes of the last era's cells, and how many were re-binned per era."
+  return obj(it=Codes, code={}, rebins=[])
+
+def codesEra(codes:obj, model:DATA, use:list[NUM], rows:ROWS) -> dict:
+  "Codes for the Num cells of `rows` read by `use`, keyed (id(row), at)."
+  old, new, kept, rebins = codes.code, {}, 0, 0
+  for at in {slot.at for slot in use}:
+    if (col := model.cols.all[at]).it is not Num: continue
+    lo, hi, tiny = codesEdges(col)
+    for row in rows:
+      if (v := row[at]) == "?": continue
+      k = old.get((id(row), at))
+      if k is not None and k < the.bins and lo[k] + tiny < v < hi[k] - tiny: 
+        kept += 1
+      else: 
+        k, rebins = bin(col, v), rebins + 1
+      new[id(row), at] = k
+  codes.code = new
+  codes.rebins += [obj(kept=kept, rebins=rebins)]
+  return new
+
+def codesEdges(col:NUM) -> tuple[list[float], list[float], float]:
+  "Lower and upper bounds of each bin of `col`, and a margin for float error."
+  sd  = col.sd + 1e-32
+  cut = [col.mu + sd*log(k/(the.bins - k))/1.7 for k in range(1, the.bins)]
+  return [-1e32] + cut, cut + [1e32], 1e-9*(sd + abs(col.mu))
+
+def scoreGet(model, use, row:ROW, code:dict=None) -> ROW:
+  "Sum the score of the bins used by `row` (`code`: see `codesEra`)."
   n = 0
   for slot in use:
     if (v := row[slot.at]) != "?":
-      if bin(model.cols.all[slot.at], v) == slot.of:
+      k = (bin(model.cols.all[slot.at], v) if code is None 
+           else code.get((id(row), slot.at), v)) # Syms are not coded
+      if k == slot.of:
         n += want(slot)
   return n
 
-def scorePut(data:DATA, row:ROW, score:QTY):
-  "Increment the bins used by `row`."
+def scorePut(data:DATA, row:ROW, score:QTY) -> list[NUM]:
+  "Increment the bins used by `row`. Returns those bins."
+  top, out = data._top, []
   for x in data.cols.x:
     if (b := bin(x, row[x.at])) != "?":
       one = x.bins[b] = x.bins.get(b) or Num()
       one.at, one.of = x.at, b
       add(one, score)
-  return row
+      if top: topsPut(top, one)
+      out += [one]
+  return out
 
 def want(slot): return slot.mu  + slot.sd/sqrt(slot.n)
 
 def top(data):
+  "The 3rd to 5th best bins (ascending), as `sorted(all bins, key=want)[-5:-2]`."
+  if data._top: return tops(data._top, 5)[2:][::-1]
   tmp = sorted((slot for x in data.cols.x for slot in x.bins.values()),key=want)
   return tmp[-5:-2] 
 
-def score1(data:DATA):
-  "Guess next few scores using scores seen to date."
+def score1(data:DATA, codes:obj=None):
+  "Guess next few scores using scores seen to date. `codes`: see `Codes`, False=off."
   best_score, best_row = 1e32, None
+  codes = Codes() if codes is None else codes
   rows = shuffle(data.rows)
   seen, model = set(), Data([data.cols.names])
+  if the.tops: model._top = Tops(model)
   for j, row in enumerate(rows):
     if len(seen) >= the.Budget: break
     add(model, row) 
     scorePut(model, row, disty(model, row))
     seen.add(id(row))
     if (j+1) % the.era == 0 and j < len(rows) - 30:
-      use = top(model)
-      candidate = min(rows[j+1:j+30], key=lambda row: scoreGet(model,use, row))
+      use  = top(model)
+      code = codesEra(codes, model, use, rows[j+1:j+30]) if codes else None
+      candidate = min(rows[j+1:j+30], key=lambda row: scoreGet(model,use,row,code))
       seen.add(id(candidate))
       if (score := disty(model, candidate)) < best_score:
         best_score, best_row = score, candidate
@@ -342,6 +970,7 @@ def score2(data:DATA):
   rows = shuffle(data.rows)
   m = len(rows)//2
   labelled = clone(data)
+  if the.tops: labelled._top = Tops(labelled)
   for row in rows[:the.Budget-5]:
     add(labelled,row)
     scorePut(labelled, row, disty(labelled, row))
@@ -350,10 +979,48 @@ def score2(data:DATA):
   tmp = sorted(rows[m:], key=lambda row: scoreGet(labelled,use, row))
   return min(tmp[:5],  key=lambda row: disty(labelled,row))
 
-# -----------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Online scoring, for rows that never stop coming. Only the last `the.window`
+# rows are remembered; older ones are subtracted from the model and from the
+# bins they scored (so memory does not grow with the stream).
+def lines(files=None) -> Iterable[ROW]:
+  "Rows from csv files, gzip/bz2 files, or stdin (if no files, or '-')."
+  with fileinput.input(files or ["-"], openhook=fileinput.hook_compressed,
+                       encoding="utf-8") as f:
+    for line in f:
+      if line := line.strip(): yield [coerce(s) for s in line.split(",")]
+
+def scores(src:Iterable[ROW], window=None) -> Iterable[tuple[ROW,float,ROW,float]]:
+  "Per era of rows from `src`: yield our guess (from bin scores) and the best seen."
+  window = window or the.window
+  model, recent, era = None, deque(), []
+  best_score, best_row = 1e32, None
+  for row in src:
+    if model is None: 
+      model = Data([row]); model._top = the.tops and Tops(model); continue
+    era += [row]
+    if len(era) < the.era: continue
+    use   = top(model)
+    guess = min(era, key=lambda r: scoreGet(model, use, r))
+    for r in era: # now we see how they scored
+      add(model, r)
+      recent.append((r, y := disty(model, r), scorePut(model, r, y)))
+      if y < best_score: best_score, best_row = y, r
+    while len(recent) > window:
+      r, y, slots = recent.popleft()
+      sub(model, r)
+      for slot in slots:
+        sub(slot, y)
+        if slot.n > 0: model._top and topsPut(model._top, slot)
+        elif model.cols.all[slot.at].bins.pop(slot.of, None) and model._top: 
+          topsPop(model._top, slot)
+    yield guess, disty(model, guess), best_row, best_score
+    era = []
+
+# -----------------------------------------------------------------------------
 def o(x):
   "Pretty print."
-  if type(x) is type(o) : return x.__name__ + '()'
+  if type(x) in (type(o), type) : return x.__name__ + '()'
   if type(x) is float : return str(int(x)) if x == int(x) else f"{x:,.2f}"
   if type(x) is list : return "["+(', '.join(o(y) for y in x))+"]"
   return str(x)
@@ -378,6 +1045,39 @@ def go__data(f = None) -> None:
   print(data.cols.x[-1])
   print(len(data.rows),data.rows[1])
 
+def go__cache(f = None):
+  f = f or the.file
+  if os.path.exists(f + ".binr"): os.remove(f + ".binr")
+  a, b = Data(f), Data(f)
+  assert os.path.exists(f + ".binr") and a.rows == b.rows and a.cols == b.cols
+  big = f + ".big.csv" # ints beyond int64 are cached as symbols
+  with open(big, "w") as fp: fp.write("A,b,C-\n1,%d,2\n3,%d,4\n" % (2**70, -2**70))
+  for _ in range(2): assert Data(big).rows == [[1, 2**70, 2], [3, -2**70, 4]]
+  for x in [big, big + ".binr"]: os.remove(x)
+  print(len(b.rows), b.cols.y[0])
+
+def go__merge(f = None):
+  data = Data(f or the.file)
+  a, b = clone(data, data.rows[:100]), clone(data, data.rows[100:])
+  ab   = merge(a, b)
+  for c1,c2 in zip(ab.cols.all, data.cols.all):
+    assert c1.n == c2.n
+    if c1.it is Sym: assert c1.has == c2.has
+    else: assert abs(c1.mu - c2.mu) < 1e-9 and abs(c1.sd - c2.sd) < 1e-9 
+  print(o(mid(merge(ab, b, -1))), o(mid(a)), sep="\n")
+
+def go__keep(f = None):
+  data, some = Data(f or the.file), Data(f or the.file, keep=50)
+  assert len(some.rows) == 50 and some.n == data.n
+  for c1,c2 in zip(data.cols.all, some.cols.all):
+    assert c1.n == c2.n and (c1.it is Sym or abs(c1.mu - c2.mu) < 1e-9)
+  assert len(clone(some, data.rows[:100]).rows) == 100 # clones keep all, by default
+  both = merge(some, clone(some, data.rows[:100]))
+  assert len(both.rows) == 50 and both.n == some.n + 100
+  for row in data.rows: sub(some, row)
+  assert some.n == 0 and some.rows == []
+  print(o(mid(data)), o(mid(both)), sep="\n")
+
 def go__disty(f = None):
   ys, data = Num(), Data(f or the.file)
   print(*[col.of for col in data.cols.all],"y",sep="\t")
@@ -392,6 +1092,49 @@ def go__distx(f = None):
   for r in sorted(data.rows,key=X)[::20]:
     print(*r,X(r),sep="\t")
 
+def go__near(f = None):
+  data = Data(f or the.file)
+  rows = shuffle(data.rows[:])
+  vp   = Vp(data, rows[:len(rows)//2])
+  for row in rows[len(rows)//2:]: vpAdd(vp, row)
+  D = lambda r1,r2: distx(vp.data, r1, r2)
+  for q in rows[:20]:
+    all = sorted(D(q,row) for row in rows)
+    assert [d for d,_ in vpNear(vp, q, k=5)] == all[:5]
+    assert [d for d,_ in vpNear(vp, q, k=None, r=all[10])] == [d for d in all if d <= all[10]]
+  d, row = vpNear(vp, rows[0], k=2)[1]
+  print(o(row), o(d), f"distx calls per query: {vp.calls//40} of {len(rows)}")
+
+def go__pairs(f = None):
+  data = Data(f or the.file)
+  rows = data.rows[:300]
+  t = time.perf_counter(); want = [[distx(data,r1,r2) for r2 in rows] for r1 in rows]
+  t = time.perf_counter() - t
+  u = time.perf_counter(); got = pairs(data, rows, tile=64); u = time.perf_counter() - u
+  assert all(abs(a - b) < 1e-5 for x,y in zip(want,got) for a,b in zip(x,y))
+  for r,near in enumerate(nearest(data, rows, k=3, tile=64)):
+    ds = sorted(d for r2,d in enumerate(want[r]) if r2 != r)[:3]
+    assert all(abs(a - b) < 1e-9 for a,(b,_) in zip(ds, near))
+    assert all(abs(d - distx(data, rows[r], r2)) < 1e-9 for d,r2 in near)
+  print(f"{len(rows)}^2 distx: {t:.2f} secs; pairs: {u:.3f} secs")
+
+def go__cluster(f = None):
+  data = Data(f or the.file)
+  t    = time.perf_counter(); tree = Cluster(data); t = time.perf_counter() - t
+  got  = list(leaves(tree))
+  assert sum(len(d.rows) for d in got) == len(data.rows)
+  assert (Counter(tuple(r) for d in got for r in d.rows) == 
+          Counter(tuple(r) for r in data.rows))
+  for d in sorted(got, key=lambda d: disty(data, mid(d)))[:5]:
+    print(len(d.rows), o(mid(d)), o(disty(data, mid(d))))
+  print(f"{len(got)} leaves, {len(data.rows)} rows, {t:.2f} secs")
+  rows = data.rows[:40] # more rows than `batch`: same codes in every batch?
+  D    = _distxTo(data, rows, batch=8)
+  for k in range(len(rows)):
+    got = D(numpy.arange(len(rows)) if numpy else range(len(rows)), k)
+    assert all(abs(d - distx(data, r, rows[k])) < 1e-9 for d,r in zip(got, rows))
+
+
 def go__inc(f=None):
   data1 = Data(f or the.file)
   data1.rows = shuffle(data1.rows) # what happens in this line commented out?
@@ -407,9 +1150,40 @@ def go__inc(f=None):
 def f(x)    : return 1.61 + 2.1*x[0] - 3.5*(x[1]*2) + 4*(x[2]**3) - 5*(x[3]**4)
 def fx(row) : print(obj(best=row, y=f(row)))
 
+def go__mix(f = None):
+  data = Data(f or the.file)
+  for fast in [0,1]:
+    random.seed(the.seed)
+    t = time.perf_counter()
+    if fast: rows = mixtures(data, 10_000)
+    else:
+      any  = lambda: random.choice(data.rows)
+      rows = [mixture(data, any(), any(), any()) for _ in range(10_000)]
+    t = time.perf_counter() - t
+    print(f"{t:.2f} secs", o(mid(clone(data, rows))))
+  random.seed(the.seed); a = mixtures(data, 20)
+  random.seed(the.seed); assert a == mixtures(data, 20)
+
 def go__random(_):
   cols = [Num(100,10), Num(20,5), Num(10,4), Num(3,2)]
-  fx( min((sample(cols) for _ in range(1000)), key=f))
+  fx( min(samples(cols, 1000), key=f))
+
+def go__sample(_):
+  cols = [Num(100,10), Tri(0,2,10), adds("aaaabbc",Sym())]
+  for polar in [False, True]:
+    t = time.perf_counter()
+    one = [[marsagliaPolar(c.mu,c.sd) if polar and c.it is Num else sample(c) 
+            for c in cols] for _ in range(10**5)]
+    t = time.perf_counter() - t
+    u = time.perf_counter(); many = samples(cols, 10**5, polar)
+    u = time.perf_counter() - u
+    for a,b in zip(zip(*one), zip(*many)):
+      a,b = [adds(z, Sym() if type(z[0]) is str else Num()) for z in (a,b)]
+      if a.it is Sym: assert all(abs(a.has[k] - b.has[k]) < a.n/100 for k in a.has)
+      else: assert abs(a.mu - b.mu) < a.sd/20 and abs(a.sd - b.sd) < a.sd/20
+    print(f"polar={polar} one: {t:.2f} secs  block: {u:.2f} secs", o(many[0]))
+  random.seed(the.seed); a = samples(cols, 100)
+  random.seed(the.seed); assert a == samples(cols, 100)
 
 def go__hclimb(_):
   m,r   = 100,9
@@ -427,10 +1201,55 @@ def win(data):
   return lambda r: int(100*(1 - (disty(data,r) - lo)/(mid - lo)))
 
 def go__score1(f= None,fn=score1):
-  data = Data(f or the.file)
+  data = Data(f or the.file, the.keep)
   w = win(data)
   print(*sorted(w(fn(data)) for _ in range(the.repeats)))
 
+def go__stream(f = None):
+  s = Sym() # what leaves the window is forgotten
+  for k in range(1000): add(s, k); k > 9 and sub(s, k - 10)
+  assert len(s.has) == 10
+  for n,(guess,y,best,y1) in enumerate(scores(lines([f or the.file]))):
+    print(n, o(y), o(guess), o(y1), o(best), sep="\t")
+
+def go__top(f = None):
+  data = Data(f or the.file)
+  def run(heap, check=False):
+    model, recent = clone(data), deque()
+    if heap: model._top = Tops(model)
+    for j,row in enumerate(data.rows):
+      add(model, row)
+      recent.append((y := disty(model,row), scorePut(model, row, y)))
+      if len(recent) > the.window: # as in `scores`
+        y, slots = recent.popleft()
+        for slot in slots:
+          sub(slot, y)
+          if slot.n > 0: heap and topsPut(model._top, slot)
+          elif model.cols.all[slot.at].bins.pop(slot.of, None) and heap: 
+            topsPop(model._top, slot)
+      if j % the.era == 0:
+        got = top(model)
+        if check:
+          model._top, b4 = None, model._top
+          assert got == top(model); model._top = b4
+  for heap in [0,1]:
+    t = time.perf_counter(); run(heap); t = time.perf_counter() - t
+    print(f"heap={heap} {t:.2f} secs")
+  random.seed(the.seed); run(1, check=True)
+
+def go__rebin(f = None):
+  data = Data(f or the.file)
+  rows = data.rows[:]
+  for codes in [False, Codes()]:
+    data.rows = rows[:]
+    random.seed(the.seed); t = time.perf_counter()
+    got = [id(score1(data, codes)) for _ in range(the.repeats)]
+    print(f"cache={bool(codes)} {time.perf_counter() - t:.2f} secs")
+    if codes: assert got == b4 # same picks, with or without the cache
+    b4 = got
+  n = len(codes.rebins)
+  print(o(obj(eras=n, **{k: sum(e[k] for e in codes.rebins)/n for k in ["kept","rebins"]})))
+
 def go__score2(f= None): return go__score1(f=f,fn=score2)
 
 _tests= {k:fun for k,fun in vars().items() if "go__" in k}
@@ -439,14 +1258,68 @@ def go__all(_):
   for k,fun in _tests.items(): 
     if k != "go_all": print("\n----- "+k); random.seed(the.seed); fun(_)
 
+# ------------------------------------------------------------------------------
+HOT = "add adds _csv norm bin dist disty distx mixtures scoreGet scorePut top"
+
+def profile(funs:dict, hot=HOT) -> dict:
+  """Swap `hot` globals for wrappers logging calls, wall time and peak memory
+  (tracemalloc) per call path (e.g. `score1>scorePut>bin`); report at exit."""
+  import tracemalloc, atexit, functools, inspect
+  stack, stats = [], {}
+  def enter(name):
+    now, peak = tracemalloc.get_traced_memory()
+    if stack: stack[-1].peak = max(stack[-1].peak, peak)
+    tracemalloc.reset_peak()
+    key = f"{stack[-1].key}>{name}" if stack else name
+    stack.append(obj(key=key, t=time.perf_counter(), mem=now, peak=now))
+  def exit():
+    f = stack.pop()
+    f.peak = max(f.peak, tracemalloc.get_traced_memory()[1])
+    if stack: stack[-1].peak = max(stack[-1].peak, f.peak)
+    s = stats.setdefault(f.key, obj(calls=0, secs=0, kb=0))
+    s.calls += 1
+    s.secs  += time.perf_counter() - f.t
+    s.kb     = max(s.kb, (f.peak - f.mem)/1024)
+  def wrap(name, fun):
+    if inspect.isgeneratorfunction(fun): # time the generator, not its users
+      @functools.wraps(fun)
+      def gen(*args, **kw):
+        src = fun(*args, **kw)
+        while True:
+          enter(name)
+          try: x = next(src)
+          except StopIteration: return
+          finally: exit()
+          yield x
+      return gen
+    @functools.wraps(fun)
+    def call(*args, **kw):
+      enter(name)
+      try: return fun(*args, **kw)
+      finally: exit()
+    return call
+  def report():
+    rows = sorted(stats.items(), key=lambda kv: -kv[1].secs)
+    if str(the.Profile).endswith(".json"):
+      with open(the.Profile, "w") as f: 
+        json.dump([dict(path=k, **v) for k,v in rows], f, indent=1)
+    else:
+      print(f"\n{'secs':>9} {'calls':>9} {'peakKB':>9}  path")
+      for k,v in rows: print(f"{v.secs:9.3f} {v.calls:9} {v.kb:9.1f}  {k}")
+  tracemalloc.start()
+  atexit.register(report)
+  for name in hot.split(): funs[name] = wrap(name, funs[name])
+  return stats
+
 # ------------------------------------------------------------------------------
 def main(funs):
   for n, s in enumerate(sys.argv):
     v = sys.argv[n+1] if n < len(sys.argv) - 1 else None
     if fn := funs.get(f"go{s.replace('-', '_')}"):  
+      if the.Profile and "_profiled" not in funs: funs["_profiled"] = profile(funs)
       fn(v)
     else:
-      for k,v in the.items():
+      for k in the:
         if s=="-"+k[0]: the[k] = coerce(v)
 
 if __name__ == "__main__": main(vars())
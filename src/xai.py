@@ -22,13 +22,25 @@ Options:
   -b bins=7         set number of bins for discretization   
   -B Budget=30      set number of rows to evaluate   
   -C Check=5        set number of guesses to check   
+  -c cols=all       set x columns searched per node (all, sqrt, or a number)   
   -d data=data.csv  set data to load   
+  -D Depth=0        set max tree depth (0 means no limit)   
+  -e evals=0        set max cut searches per tree (0 means no limit)   
+  -F Fork=0         set min rows in subtrees grown by other processes (0 means never)   
+  -g gain=0         set min score gain per split (0 means any gain)   
+  -k keep=0         set rows kept in memory (0 means all, else a random sample)   
   -l leaf=2         set examples per leaves in a tree   
-  -s seed=1         set random number seed   """
-import ast,sys,random,re
+  -p profile=0      profile hot paths (0 is off, 1 prints, FILE.json saves)   
+  -P Procs=1        set processes for repeats, or for -F (1 means serial)   
+  -s seed=1         set random number seed   
+  -t time=0         set seconds to grow a tree (0 means no limit)   """
+import ast,sys,random,re,heapq,multiprocessing,os,json,time,mmap
+from array import array
 from math import sqrt,exp,floor
 from types import SimpleNamespace as obj
 from pathlib import Path
+try: import numpy as np # optional: only used by the batch kernels
+except ImportError: np = None
 
 BIG=1e32
 
@@ -47,10 +59,16 @@ def Cols(names): # (list[str]) -> Cols
              x=[col for col in cols if col.txt[-1] not in "+-X"],
              y=[col for col in cols if col.txt[-1] in "+-"])
 
-def Data(rows=None):
-  return adds(rows, obj(it=Data, rows=[], n=0, cols=None, _centroid=None))
+def Data(rows=None, keep=0): # rows, or a csv file name (see `cached`)
+  if isinstance(rows, (str,Path)): 
+    if not keep: return cached(rows)
+    rows = csv(rows) # streamed: never all in memory
+  return adds(rows, obj(it=Data, rows=[], n=0, cols=None, _centroid=None,
+                        _mat=None, _ys=None, _at=None, _syms={}, hits=0, misses=0, 
+                        keep=keep))
 
-def clone(data, rows=None): return adds(rows, Data([data.cols.names]))
+def clone(data, rows=None, keep=0): # `keep` is not copied from `data`
+  return adds(rows, Data([data.cols.names], keep))
 
 ### Update ----------------------------------------------------------------
 def adds(src, i=None): # (src:Iterable, ?i) -> i
@@ -68,13 +86,71 @@ def add(i, v, inc=1):
         else:
           d = v-i.mu; i.mu += inc*d/i.n; i.m2 += inc*d*(v-i.mu)
       else:
-        i._centroid = None # old centroid now out of date
+        i._centroid = i._mat = None # old centroid, matrix now out of date
+        if any(v[y.at] != "?" for y in i.cols.y): i._ys = None # goals moved
         [add(col, v[col.at], inc) for col in i.cols.all] # recursive add 
-        (i.rows.append if inc>0 else i.rows.remove)(v)   # row storage
+        store(i, v, inc) # row storage
   return v # convention: always return the thing being added
 
+def store(data, row, inc=1): # append, or swap-delete `row` in O(1)
+  rows, at = data.rows, data._at # `at` maps rows to positions (made on demand)
+  if inc > 0 and data.keep and len(rows) >= data.keep: # reservoir is full
+    if (j := random.randrange(data.n)) < data.keep: # keep with p=keep/n
+      rows[j], data._at = row, None
+    return
+  if inc > 0:
+    rows.append(row)
+    if at is not None: at.setdefault(tuple(row),[]).append(len(rows) - 1)
+    return
+  k, n = tuple(row), len(rows) - 1
+  fresh = (at is not None and n >= 0 and n in at.get(tuple(rows[n]),()) and
+           (k not in at or (at[k][-1] <= n and rows[at[k][-1]] == row)))
+  if not fresh or (k not in at and not data.keep): # rows reordered, or really missing?
+    at = data._at = {}
+    for j,r in enumerate(rows): at.setdefault(tuple(r),[]).append(j)
+  if k not in at: 
+    if data.keep: return # not in the sample; summaries already updated
+    raise ValueError("row not in data")
+  j = at[k].pop()
+  if not at[k]: del at[k]
+  last = rows.pop()
+  if j < n:
+    rows[j] = last
+    js = at[tuple(last)]
+    js[js.index(n)] = j
+
+def merge(i, j, inc=1): # -> new i+j (or i-j if inc=-1). Nums use Chan et al.
+  if Data is i.it:
+    k = clone(i, keep=i.keep)
+    for a,b,c in zip(k.cols.all, i.cols.all, j.cols.all): 
+      vars(a).update(vars(merge(b, c, inc)))
+    k.n, k.rows = i.n + inc*j.n, i.rows[:]
+    if k.keep and inc > 0: k.rows = sampled([i,j], k.keep)
+    else: [store(k, row, inc) for row in j.rows]
+    return k
+  k = i.it()
+  k.n = i.n + inc*j.n
+  if Sym is i.it:
+    k.has = {v: i.has.get(v,0) + inc*j.has.get(v,0) for v in i.has | j.has}
+  elif k.n > 0:
+    if inc > 0:
+      d = j.mu - i.mu
+      k.mu = i.mu + d*j.n/k.n
+      k.m2 = i.m2 + j.m2 + d*d*i.n*j.n/k.n
+    else:
+      k.mu = (i.n*i.mu - j.n*j.mu) / k.n
+      k.m2 = i.m2 - j.m2 - (j.mu - k.mu)**2 * k.n*j.n/i.n
+  else: k.n = 0
+  return k
+
+def sampled(datas, keep): # -> up to `keep` rows; each part weighted by its n
+  keys = ((random.random() ** (len(d.rows)/d.n), row) # Efraimidis-Spirakis
+          for d in datas if d.rows for row in d.rows)
+  return [row for _,row in heapq.nlargest(keep, keys, key=lambda kr: kr[0])]
+
 ### Queries ----------------------------------------------------------------
 def norm(num,n):
+  if n=="?": return n
   z = (n - num.mu) / sd(num)
   z = max(-3, min(3, z))
   return 1 / (1 + exp(-1.7 * z))
@@ -87,7 +163,16 @@ def mids(data):
   data._centroid = data._centroid or [mid(col) for col in data.cols.all]
   return data._centroid
 
-def disty(data,row):
+def disty(data,row): # memoized (from `_disty`, not `distys`), reset by `add`
+  if data._ys is None:
+    data._ys = {id(r):(r,_disty(data,r)) for r in data.rows}
+  if (hit := data._ys.get(id(row))) and hit[0] is row:
+    data.hits += 1
+    return hit[1]
+  data.misses += 1
+  return _disty(data,row)
+
+def _disty(data,row):
   ys = data.cols.y
   return sqrt(sum(abs(norm(y,row[y.at]) - y.target)**2 for y in ys) / len(ys))
 
@@ -103,7 +188,56 @@ def _aha(col,u,v):
   v = v if v != "?" else (0 if u>0.5 else 1)
   return abs(u - v)
 
-## Cutting -------------------------------------------------------------------
+### Batch queries ----------------------------------------------------------
+# With NumPy, rows become a matrix of normalized cells (NaN for "?"; symbols
+# become integer codes). Without it, these are just loops over `_disty,distx`.
+def Mat(data, rows):
+  return obj(it=Mat, at={id(row):k for k,row in enumerate(rows)},
+             x=_cells(data.cols.x, rows, data._syms), 
+             y=_cells(data.cols.y, rows, data._syms),
+             num=np.array([Num is col.it for col in data.cols.x], dtype=bool))
+
+def mat(data, rows=None): # matrix for `rows`, gathered from a cache of all rows
+  rows = data.rows if rows is None else rows
+  if not (m := data._mat) or len(m.at) != len(data.rows):
+    m = data._mat = Mat(data, data.rows) # reset by `add`
+  if None in (at := [m.at.get(id(row)) for row in rows]): return Mat(data,rows)
+  return obj(it=Mat, at=None, x=m.x[at], y=m.y[at], num=m.num)
+
+def _cells(cols, rows, syms): # `syms`: per column, a code per symbol (kept by Data)
+  out = np.full((len(rows), len(cols)), np.nan)
+  for j,col in enumerate(cols):
+    vals = [row[col.at] for row in rows]
+    ok   = np.array([v != "?" for v in vals], dtype=bool)
+    if Sym is col.it:
+      codes = syms.setdefault(col.at, {}) # unseen symbols get their own code too
+      out[ok,j] = [codes.setdefault(v, len(codes)) for v in vals if v != "?"]
+    elif ok.any():
+      z = (np.array([v for v in vals if v != "?"],dtype=float) - col.mu)/sd(col)
+      out[ok,j] = 1 / (1 + np.exp(-1.7 * np.clip(z, -3, 3)))
+  return out
+
+def distys(data, rows=None): # -> distance to heaven of every row
+  rows = data.rows if rows is None else rows
+  if np is None: return [_disty(data,row) for row in rows]
+  goals = np.array([col.target for col in data.cols.y], dtype=float)
+  return np.sqrt(np.sum((mat(data,rows).y - goals)**2, axis=1) / len(goals))
+
+def distxs(data, row, rows=None): # -> distance from `row` to every row
+  rows = data.rows if rows is None else rows
+  if np is None: return [distx(data,row,r) for r in rows]
+  m = mat(data,rows)
+  return _ahas(m.num, Mat(data,[row]).x, m.x)
+
+def _ahas(num, u, v): # vectorized `_aha`, then Minkowski (p=2) over columns
+  u = np.broadcast_to(u, v.shape)
+  nu, nv = np.isnan(u), np.isnan(v)
+  u1 = np.where(nu, np.where(v > 0.5, 0., 1.), u)
+  v1 = np.where(nv, np.where(u1 > 0.5, 0., 1.), v)
+  d = np.where(nu & nv, 1., np.where(num, np.abs(u1 - v1), u != v))
+  return np.sqrt(np.sum(d**2, axis=1) / u.shape[1])
+
+## Cutting -------------------------------------------------------------------
 def Cut(at,txt,lo,hi): 
   return obj(it=Cut, at=at, txt=txt, xlo=lo, xhi=hi, y=Num())
 
@@ -126,9 +260,14 @@ def cutScore(cut):
   if cut.y.n<the.leaf: return BIG
   return cut.y.mu + sd(cut.y) / (sqrt(cut.y.n) + 1/BIG)
 
-def cutBest(data, rows):
-  all_bins = (b for col in data.cols.x for b in cutsAll(col, rows, data))
-  return min(all_bins, key=lambda b: cutScore(b), default=None)
+def cutBest(data, rows, bins=None, hist=None):
+  bins = bins or Bins(data, rows)
+  hist = hists(bins, rows) if hist is None else hist
+  all_bins = (b for col,h,lo in zip(data.cols.x, hist, bins.lo) 
+                for b in cutsHist(col, h, lo))
+  if (cut := min(all_bins, key=cutScore, default=None)):
+    if Num is data.cols.all[cut.at].it: cutTighten(cut, data, rows, bins, hist)
+  return cut
 
 def cutsAll(col, rows, data):
   d, xys = {}, [(r[col.at], disty(data, r)) for r in rows if r[col.at]!="?"]
@@ -140,6 +279,24 @@ def cutsAll(col, rows, data):
     d[k].xhi = x
   return cutsComplete(col, sorted(d.values(), key=lambda b: b.xlo))
 
+def cutsHist(col, hist, lo):
+  cuts = []
+  for k in sorted(hist, key=lo.get):
+    if hist[k].n > 0:
+      cuts += [Cut(col.at, col.txt, lo[k], lo[k])]
+      cuts[-1].y, cuts[-1].k = hist[k], k
+  return cutsComplete(col, cuts)
+
+def cutTighten(cut, data, rows, bins, hist): # bounds from this node's x values
+  j  = [col.at for col in data.cols.x].index(cut.at)
+  ks = [k for k in sorted(hist[j]) if hist[j][k].n > 0]
+  n  = ks.index(cut.k)
+  lo = {k:BIG for k in ks[n:n+2]} # smallest x here, and in the next bin
+  for row in rows:
+    if (k := bins.code[id(row)][j]) in lo: lo[k] = min(lo[k], row[cut.at])
+  if n > 0         : cut.xlo = lo[ks[n]]
+  if n < len(ks)-1 : cut.xhi = lo[ks[n+1]]
+
 def cutsComplete(col, cuts):
   if Num is col.it:
     for n, b in enumerate(cuts):
@@ -147,28 +304,145 @@ def cutsComplete(col, cuts):
       b.xhi = cuts[n+1].xlo if n < len(cuts)-1 else BIG
   return cuts
 
+## Histograms --------------------------------------------------------------
+# Bin each x value once: `code[id(row)][j]` is the bin of the j-th x column
+# (a symbol, or `floor(the.bins*norm)`) and `lo[j][k]` is the smallest x seen
+# in bin `k`. Nodes score cuts from `hists` of `disty` per bin, then
+# `cutTighten` resets the winner's bounds from the node's own x values.
+def Bins(data, rows):
+  ys, codes, los = {}, {}, [{} for _ in data.cols.x]
+  for row in rows:
+    ys[id(row)], codes[id(row)] = disty(data,row), []
+    for col,lo in zip(data.cols.x, los):
+      if (x := row[col.at]) == "?": k = None
+      else:
+        k = x if Sym is col.it else floor(the.bins * norm(col, x))
+        lo[k] = min(x, lo.get(k,x))
+      codes[id(row)] += [k]
+  return obj(it=Bins, y=ys, code=codes, lo=los)
+
+def hists(bins, rows, js=None): # -> per x column, {bin: Num of disty}
+  out = [{} for _ in bins.lo]
+  for row in rows:
+    y, ks = bins.y[id(row)], bins.code[id(row)]
+    for hist,k in (zip(out, ks) if js is None else ((out[j],ks[j]) for j in js)):
+      if k is not None:
+        if k not in hist: hist[k] = Num()
+        add(hist[k], y)
+  return out
+
+def histsVary(hist): # -> positions of x columns whose bins differ in mean y
+  return [j for j,h in enumerate(hist) 
+          if len(mus := [num.mu for num in h.values() if num.n]) > 1 
+          and max(mus) > min(mus)]
+
+def histsSub(hist1, hist2): # -> hist1 - hist2 (e.g. parent minus one kid)
+  return [{k: merge(num, h2[k], -1) if k in h2 else num for k,num in h1.items()}
+          for h1,h2 in zip(hist1, hist2)]
+
 ## Trees -------------------------------------------------------------------
-# Trees recursively cut data.
+# Trees recursively cut data. Nodes are split best gain first (gain = how
+# much the best cut's score beats the node's mean disty, times its size),
+# so a tree stopped early by `the.time`, `the.evals` or `the.Depth` still
+# has its most useful cuts. With no limits, the tree is the same as
+# growing depth first. For wide data, `the.cols` searches a random subset
+# of the x columns at each node (drawn from the columns whose bins, at the
+# root, show any variance in y). Subsets are seeded by the node's path, so 
+# they do not depend on the order nodes are grown. With `the.Fork` and 
+# `the.Procs`, big subtrees grow in other processes (see `_growInit`).
 def Tree(n, mu, mids, cut, goals):
   return obj(it=Tree, n=n, mu=mu, mids=mids, cut=cut, kids={}, goals=goals)
 
-def treeGrow(data, rows=None, cut=None, uses=set()):
+def treeGrow(data, rows=None, cut=None, uses=set(), bins=None, hist=None, 
+             ys=None):
+  end  = time.perf_counter() + (the.time or BIG)
   rows = rows or data.rows
-  centroid=mids(clone(data,rows))
-  tree = Tree(len(rows), 
-              disty(data,centroid),
-              [centroid[col.at] for col in data.cols.y],
-              cut,
-              [col.txt for col in data.cols.y])
-  if len(rows) > the.leaf*2:
-    if cut1 := cutBest(data,rows):
-      ok,no = [],[]
-      for row in rows: (ok if cutSelects(cut1,row) else no).append(row)
-      if ok and no:
-        uses.add(cut1.txt)
-        tree.kids[True]  = treeGrow(data, ok, cut1, uses)
-        tree.kids[False] = treeGrow(data, no, cut1, uses)
-  return tree
+  bins = bins or Bins(data, rows)
+  wide = None
+  if the.cols != "all": # random subspaces
+    hist = hists(bins, rows) if hist is None else hist
+    js   = histsVary(hist)
+    wide = obj(js=js, salt=random.random(), k=min(len(js), 
+               the.cols if the.cols != "sqrt" else max(1, round(sqrt(len(js))))))
+  if not (the.Fork and the.Procs > 1 and not the.time and not the.evals
+          and not multiprocessing.current_process().daemon):
+    return _grow(data, rows, cut, uses, bins, hist, ys, "", wide, end)
+  with multiprocessing.Pool(the.Procs, _growInit, (data, rows, the, bins.lo,
+         [bins.y[id(r)] for r in rows], [bins.code[id(r)] for r in rows])) as pool:
+    return _grow(data, rows, cut, uses, bins, hist, ys, "", wide, end, pool)
+
+def _grow(data, rows, cut, uses, bins, hist, ys, path, wide, end, pool=None):
+  evals, jobs = the.evals or BIG, []
+  todo, seq = [], 0 # heap of (-gain*n, seq, tree, rows, cut, hist, ys, path)
+  if pool: at, most = {id(row):j for j,row in enumerate(rows)}, len(rows)/the.Procs
+  def node(rows, cut, hist, ys, path): # -> Tree; queue it, if it can be cut
+    nonlocal evals, seq
+    if wide: 
+      hist = hists(bins, rows, random.Random(f"{wide.salt}/{path}").sample(
+                                                            wide.js, wide.k))
+    hist = hists(bins, rows) if hist is None else hist
+    ys   = ys or summary(data.cols.y, rows)
+    centroid = {col.at:mid(y) for col,y in zip(data.cols.y, ys)}
+    tree = Tree(len(rows), 
+                disty(data,centroid),
+                [centroid[col.at] for col in data.cols.y],
+                cut,
+                [col.txt for col in data.cols.y])
+    if (len(rows) > the.leaf*2 and len(path) < (the.Depth or BIG) and evals > 0
+        and time.perf_counter() < end):
+      evals -= 1
+      if cut1 := cutBest(data, rows, bins, hist):
+        gain = sum(bins.y[id(row)] for row in rows)/len(rows) - cutScore(cut1)
+        if not the.gain or gain >= the.gain:
+          seq += 1
+          heapq.heappush(todo, (-gain*len(rows), seq, tree, rows, cut1, hist,
+                                ys, path))
+    return tree
+  root = stage(f"depth{len(path)}", node, rows, cut, hist, ys, path)
+  while todo and time.perf_counter() < end:
+    *_, tree, rows, cut1, hist, ys, path = heapq.heappop(todo)
+    ok,no = [],[]
+    for row in rows: (ok if cutSelects(cut1,row) else no).append(row)
+    if ok and no:
+      uses.add(cut1.txt)
+      small = min(ok, no, key=len) # only scan the smaller kid...
+      ys1 = summary(data.cols.y, small)
+      ys2 = [merge(a,b,-1) for a,b in zip(ys,ys1)]
+      hs = hb = None # random subspaces bin each node afresh
+      if not wide: hs = hists(bins, small); hb = histsSub(hist, hs)
+      if small is no: hs, ys1, hb, ys2 = hb, ys2, hs, ys1 # ...parent - it
+      for k,rows1,hist1,ys1 in [(True,ok,hs,ys1), (False,no,hb,ys2)]:
+        if pool and the.Fork <= len(rows1) <= most: # grow elsewhere
+          tree.kids[k] = None
+          jobs += [(tree, k, pool.apply_async(_growJob, ([at[id(r)] for r in rows1],
+                            cut1, hist1, ys1, path + "01"[k], wide)))]
+        else: tree.kids[k] = stage(f"depth{len(path)+1}", node, rows1, cut1,
+                                   hist1, ys1, path + "01"[k])
+  for tree, k, job in jobs:
+    tree.kids[k], uses1 = job.get()
+    uses |= uses1
+  return root
+
+# Subtrees (`the.Fork` or more rows, but at most 1/`the.Procs` of the rows)
+# grow in a pool. Each process gets the data and bins once. Bins are keyed by 
+# row id, so they are re-keyed there. Jobs are just row positions and node 
+# state (cut, hist, ys, path), so results match the serial tree exactly.
+def _growInit(data, rows, settings, lo, ys, codes):
+  global _g, the
+  the = settings
+  data._ys = data._mat = None # keyed on ids from the parent process
+  _g = obj(data=data, rows=rows, bins=obj(it=Bins, lo=lo,
+           y={id(r):y for r,y in zip(rows, ys)}, 
+           code={id(r):c for r,c in zip(rows, codes)}))
+
+def _growJob(js, cut, hist, ys, path, wide): # -> (subtree, uses)
+  uses = set()
+  tree = _grow(_g.data, [_g.rows[j] for j in js], cut, uses, _g.bins, hist, ys,
+               path, wide, BIG)
+  return tree, uses
+
+def summary(cols, rows): # -> summaries of `cols` (not a whole Data) for `rows`
+  return [adds((row[col.at] for row in rows), col.it()) for col in cols]
 
 def treeShow(tree, lvl=0,accept=True,width=60,dec=1):
   if lvl==0:
@@ -188,7 +462,123 @@ def treeLeaf(tree, row):
     return treeLeaf(tree.kids[cutSelects(rule, row)], row)
   return tree
 
-   
+## Flat trees ---------------------------------------------------------------
+# `Flat` compiles a tree into parallel lists (one slot per node, in preorder;
+# leaves have `yes=no=-1`) so many rows can be routed at once.
+def Flat(tree):
+  f = obj(it=Flat, at=[], lo=[], hi=[], sym=[], yes=[], no=[], mu=[])
+  def visit(t):
+    n = len(f.mu)
+    cut = t.kids[True].cut if t.kids else Cut(-1,"",0,0)
+    for k,v in dict(at=cut.at, lo=cut.xlo, hi=cut.xhi, sym=cut.xlo==cut.xhi,
+                    yes=-1, no=-1, mu=t.mu).items(): getattr(f,k).append(v)
+    if t.kids:
+      f.yes[n] = visit(t.kids[True])
+      f.no[n]  = visit(t.kids[False])
+    return n
+  visit(tree)
+  return f
+
+def flatLeaf(f, row): # -> index of the leaf selected by `row`
+  n = 0
+  while f.yes[n] >= 0:
+    x = row[f.at[n]]
+    ok = x == "?" or (x == f.lo[n] if f.sym[n] else f.lo[n] <= x < f.hi[n])
+    n = f.yes[n] if ok else f.no[n]
+  return n
+
+def flatPredict(f, rows): # -> leaf `mu` for each row
+  if np is None or not rows: return [f.mu[flatLeaf(f,row)] for row in rows]
+  codes, lo, hi = {}, [], [] # symbols in the tree become numbers
+  for a,x,y,sym in zip(f.at, f.lo, f.hi, f.sym):
+    if sym and a >= 0: d = codes.setdefault(a,{}); x = y = d.setdefault(x,len(d))
+    lo += [x]; hi += [y]
+  ats = sorted(set(f.at) - {-1})
+  xs  = np.array([[np.nan if (v := row[a]) == "?" else 
+                   (codes[a].get(v,-1) if a in codes else v) for a in ats]
+                  for row in rows], dtype=float).reshape(len(rows), len(ats))
+  col = np.array([ats.index(a) if a >= 0 else 0 for a in f.at])
+  lo, hi  = np.array(lo, dtype=float), np.array(hi, dtype=float)
+  yes, no, sym = np.array(f.yes), np.array(f.no), np.array(f.sym)
+  n = np.zeros(len(rows), dtype=int)
+  while len(live := np.nonzero(yes[n] >= 0)[0]):
+    m  = n[live]
+    x  = xs[live, col[m]]
+    ok = np.isnan(x) | np.where(sym[m], x == lo[m], (lo[m] <= x) & (x < hi[m]))
+    n[live] = np.where(ok, yes[m], no[m])
+  return np.array(f.mu)[n].tolist()
+
+def flatTop(f, rows, k): # == sorted(rows, key=leaf mu)[:k], in O(n log k)
+  mus = flatPredict(f, rows)
+  return [rows[j] for j in heapq.nsmallest(k, range(len(rows)), key=mus.__getitem__)]
+
+## Shards ------------------------------------------------------------------
+# Summarize a big csv in parallel: split it into byte ranges, let each 
+# process summarize the lines starting in its range, then `merge` them.
+def shards(file, procs=None, rows=False): # -> Data (rows only if asked)
+  procs = procs or the.Procs
+  with open(file, "rb") as f: _head(f); top, end = f.tell(), f.seek(0,2)
+  cuts = [top + (end - top)*k//procs for k in range(procs + 1)]
+  todo = [(file, lo, hi, rows) for lo,hi in zip(cuts, cuts[1:])]
+  if procs < 2: parts = [_shard(*args) for args in todo]
+  else:
+    with multiprocessing.Pool(procs) as pool: parts = pool.starmap(_shard, todo)
+  out = parts[0]
+  for part in parts[1:]: out = merge(out, part)
+  return out
+
+def _head(f): # first line that is not blank or a % comment (as per `_typed`)
+  while line := f.readline():
+    if line.decode("utf-8").split("%")[0].strip(): return line.decode("utf-8")
+
+def _shard(file, lo, hi, rows): # -> Data for the lines starting in [lo,hi)
+  with open(file, "rb") as f:
+    head = _head(f)
+    f.seek(lo - 1)
+    at = lo - 1 + len(f.readline()) # skip the end of the line before `lo`
+    def chunks(): # read, and hand on, 1MB at a time
+      nonlocal at
+      yield [head]
+      while at < hi and (lines := f.readlines(2**20)):
+        chunk = []
+        for line in lines:
+          if at >= hi: break
+          chunk += [line.decode("utf-8")]; at += len(line)
+        yield chunk
+    src  = _typed(chunks())
+    data = Data([next(src)])
+    for row in src:
+      if rows: add(data, row)
+      else: 
+        data.n += 1
+        [add(col, row[col.at]) for col in data.cols.all]
+  return data
+
+## Repeats -----------------------------------------------------------------
+# Each repeat reseeds from its own number, so it does not matter which 
+# process runs it, or in what order.
+def trial(data, r): # -> (guess, tree, uses) 
+  random.seed(f"{the.seed}/{r}")
+  rows  = shuffle(data.rows[:])
+  n     = len(rows)//2
+  uses  = set()
+  tree  = treeGrow(clone(data, rows[:n][:the.Budget-the.Check]), uses=uses)
+  guess = min(flatTop(Flat(tree), rows[n:], the.Check), 
+              key=lambda row: disty(data,row))
+  return guess, tree, uses
+
+def trials(data, repeats): # -> disty of each repeat's guess, in repeat order
+  if the.Procs < 2: return [disty(data, trial(data,r)[0]) for r in range(repeats)]
+  with multiprocessing.Pool(the.Procs, _worker, (data, the)) as pool:
+    return pool.map(_trial, range(repeats))
+
+def _worker(data, settings): # once per process, not once per repeat
+  global _data, the
+  _data, the = data, settings
+  data._ys = data._mat = None # keyed on ids from the parent process
+
+def _trial(r): return disty(_data, trial(_data, r)[0])
+
 ## Lib -----------------------------------------------------------------------
 def gauss(mid,div):
   return mid + 2 * div * (sum(random.random() for _ in range(3)) - 1.5)
@@ -212,15 +602,200 @@ def coerce(s):
       s = s.strip()
       return {"true":True, "false":False}.get(s,s)
 
-def csv(fileName):
+def csvCoerce(fileName): # reference loader: `coerce` every cell
   with open(fileName,encoding="utf-8") as f:
     for l in f:
       if (l:=l.split("%")[0].strip()):
         yield [coerce(x) for x in l.split(",")]
 
+def csv(fileName, chunk=2**20): # same rows as `csvCoerce`, but typed by column
+  with open(fileName,encoding="utf-8") as f:
+    yield from _typed(iter(lambda: f.readlines(chunk), []))
+
+def _typed(chunks): # chunks of lines -> header, then rows
+  names, convs = None, None
+  for lines in chunks:
+    rows = [s.split(",") for l in lines if (s:=l.split("%")[0].strip())]
+    if names is None and rows:
+      names = [coerce(x) for x in rows.pop(0)]
+      yield names
+    if not rows: continue
+    convs = convs or [_sniff(s, [r[j] for r in rows[:64] if len(r) > j]) 
+                      for j,s in enumerate(names)]
+    if any(len(r) != len(names) for r in rows): # ragged: no column view
+      yield from ([coerce(x) for x in r] for r in rows); continue
+    cols = [_convert(conv, col) for conv,col in zip(convs, zip(*rows))]
+    yield from map(list, zip(*cols))
+
+def _sniff(name, xs): # -> converter for a column, from its name and a sample
+  def ints(xs):
+    try: [int(x) for x in xs if x != "?"]; return True
+    except ValueError: return False
+  if ints(xs): return int
+  return _num if str(name)[:1].isupper() else _sym
+
+def _convert(conv, xs): # one converter per column; `coerce` if it ever fails
+  try: 
+    if "?" not in xs: return list(map(conv, xs))
+    return [x if x == "?" else conv(x) for x in xs]
+  except ValueError: return [coerce(x) for x in xs]
+
+def _num(x): return float(x) if "." in x else int(x)
+
+def _sym(x):
+  s = x.strip()
+  if s[:1] in "0123456789+-." or s.lower() in ("nan","inf","infinity"):
+    return coerce(x)
+  return {"true":True, "false":False}.get(s,s)
+
 def shuffle(lst): random.shuffle(lst); return lst
 
-#-----------------------------------------------------------------------------
+## Cache ---------------------------------------------------------------------
+# `Data(file)` keeps what it parsed beside the csv (as FILE.xai), keyed on
+# the csv's size and mtime. Layout: magic, header length, JSON header (names,
+# column summaries, where each column lives), then one array per column: 
+# int64 or float64 (plus a byte mask for "?") or, for anything else (e.g.
+# ints too big for int64), int32 codes into symbols kept in the header. 
+# Stale or broken caches are ignored and rewritten.
+MAGIC, INT64 = b"XAI1", (-2**63, 2**63)
+
+def cached(file): # -> Data
+  try: return cacheRead(file)
+  except Exception as _:
+    data = Data(csv(file))
+    try: cacheWrite(file, data)
+    except (OSError, TypeError, ValueError, OverflowError) as _: pass # e.g. read-only dir
+    return data
+
+def cacheRead(file): # raises if missing or stale
+  st = os.stat(file)
+  with open(f"{file}.xai", "rb") as f:
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      assert mm[:4] == MAGIC
+      n    = int.from_bytes(mm[4:12], "little")
+      head = json.loads(mm[12:12+n])
+      assert head["key"] == [st.st_size, st.st_mtime_ns]
+      base = 12 + n + (-(12+n) % 8)
+      cols = [_cacheCol(mm, base, head["rows"], c) for c in head["cols"]]
+  data = Data([head["names"]])
+  for col,stat in zip(data.cols.all, head["stats"]):
+    if Num is col.it: col.n, col.mu, col.m2 = stat
+    else: col.n, col.has = stat[0], {k:v for k,v in stat[1]}
+  data.rows, data.n = list(map(list, zip(*cols))), head["rows"]
+  return data
+
+def cacheWrite(file, data):
+  stats = [[c.n, c.mu, c.m2] if Num is c.it else [c.n, list(c.has.items())] 
+           for c in data.cols.all]
+  rows, n, cols, blobs = data.rows, len(data.rows), [], bytearray()
+  if any(len(row) != len(data.cols.names) for row in rows): 
+    raise ValueError("ragged rows")
+  def put(b): # -> offset of `b` in the body
+    at, b = len(blobs), bytes(b)
+    blobs.extend(b + bytes(-len(b) % 8))
+    return at
+  for j in range(len(data.cols.names)):
+    xs   = [row[j] for row in rows]
+    ok   = [x for x in xs if x != "?"]
+    kind = _cacheKind(ok)
+    if kind == "s":
+      codes = {}
+      for x in ok: codes.setdefault((type(x),x), len(codes))
+      at = put(array("i", [-1 if x=="?" else codes[(type(x),x)] for x in xs]))
+      cols += [dict(kind=kind, at=at, mask=None, syms=[x for _,x in codes])]
+    else:
+      at   = put(array(kind, [0 if x=="?" else x for x in xs]))
+      mask = None if len(ok) == n else put(bytes(x=="?" for x in xs))
+      cols += [dict(kind=kind, at=at, mask=mask, syms=None)]
+  st   = os.stat(file)
+  head = json.dumps(dict(key=[st.st_size, st.st_mtime_ns], rows=n, cols=cols,
+                         names=data.cols.names, stats=stats)).encode()
+  tmp  = f"{file}.xai.{os.getpid()}" # written aside, then renamed: no half caches
+  with open(tmp, "wb") as f:
+    f.write(MAGIC + len(head).to_bytes(8, "little") + head)
+    f.write(bytes(-(12 + len(head)) % 8) + blobs)
+  os.replace(tmp, f"{file}.xai")
+
+def _cacheCol(mm, base, n, c): # -> list of cells, decoded from one typed array
+  kind, size = ("i",4) if c["kind"] == "s" else (c["kind"], 8)
+  at = base + c["at"]
+  xs = memoryview(mm)[at : at + n*size].cast(kind).tolist()
+  if c["kind"] == "s": return list(map((c["syms"] + ["?"]).__getitem__, xs))
+  if c["mask"] is not None:
+    for j,m in enumerate(mm[base + c["mask"] : base + c["mask"] + n]):
+      if m: xs[j] = "?"
+  return xs
+
+def _cacheKind(ok): # "q" (int64), "d" (float64) or "s" (codes)
+  if all(type(x) is int and INT64[0] <= x < INT64[1] for x in ok): return "q"
+  if all(type(x) is float for x in ok): return "d"
+  return "s"
+
+## Profiling ---------------------------------------------------------------
+# `-p` swaps these globals for wrappers that log calls, wall time and peak
+# memory (tracemalloc) per call path, e.g. `treeGrow>depth2>cutBest>disty` 
+# is disty called by cutBest, for a node at depth 2 of a tree. Off (the 
+# default), nothing is wrapped.
+HOT = "add adds csv norm disty distys distx distxs cutBest cutsAll hists treeGrow"
+
+def stage(name, fun, *args): # with `-p`, calls to `fun` log under `name`
+  return fun(*args)
+
+def profile(funs, hot=HOT):
+  import tracemalloc, atexit, functools, inspect
+  stack, stats = [], {}
+  def enter(name):
+    now, peak = tracemalloc.get_traced_memory()
+    if stack: stack[-1].peak = max(stack[-1].peak, peak)
+    tracemalloc.reset_peak()
+    key = f"{stack[-1].key}>{name}" if stack else name
+    stack.append(obj(key=key, t=time.perf_counter(), mem=now, peak=now))
+  def exit():
+    f = stack.pop()
+    f.peak = max(f.peak, tracemalloc.get_traced_memory()[1])
+    if stack: stack[-1].peak = max(stack[-1].peak, f.peak)
+    s = stats.setdefault(f.key, obj(calls=0, secs=0, kb=0))
+    s.calls += 1
+    s.secs  += time.perf_counter() - f.t
+    s.kb     = max(s.kb, (f.peak - f.mem)/1024)
+  def wrap(name, fun):
+    if inspect.isgeneratorfunction(fun): # time the generator, not its users
+      @functools.wraps(fun)
+      def gen(*args, **kw):
+        src = fun(*args, **kw)
+        while True:
+          enter(name)
+          try: x = next(src)
+          except StopIteration: return
+          finally: exit()
+          yield x
+      return gen
+    if fun is stage:
+      def staged(name1, fun1, *args):
+        enter(name1)
+        try: return fun1(*args)
+        finally: exit()
+      return staged
+    @functools.wraps(fun)
+    def call(*args, **kw):
+      enter(name)
+      try: return fun(*args, **kw)
+      finally: exit()
+    return call
+  def report():
+    rows = sorted(stats.items(), key=lambda kv: -kv[1].secs)
+    if str(the.profile).endswith(".json"):
+      with open(the.profile, "w") as f: 
+        json.dump([dict(path=k, **vars(v)) for k,v in rows], f, indent=1)
+    else:
+      print(f"\n{'secs':>9} {'calls':>9} {'peakKB':>9}  path")
+      for k,v in rows: print(f"{v.secs:9.3f} {v.calls:9} {v.kb:9.1f}  {k}")
+  tracemalloc.start()
+  atexit.register(report)
+  for name in hot.split() + ["stage"]: funs[name] = wrap(name, funs[name])
+  return stats
+
+#-----------------------------------------------------------------------------
 the = obj(**{m[0]:coerce(m[1]) for m in re.findall(r"(\w+)=(\S+)", __doc__)})
 
 def go__all(file=the.data):
@@ -251,9 +826,47 @@ def go__csv(file=the.data):
     if n % 40==0: print(row)
   assert 3184 == total
 
+def go__csvs(file=the.data, repeats=5):
+  "FILE : benchmark rows/sec, typed vs per-cell csv loading"
+  assert list(csv(file)) == list(csvCoerce(file))
+  for f in [csvCoerce, csv]:
+    t = time.perf_counter()
+    for _ in range(repeats): n = sum(1 for _ in f(file))
+    print(f"{f.__name__:10}", o(rows=n, rowsPerSec=int(n*repeats/(time.perf_counter()-t))))
+
+def go__cache(file=the.data):
+  "FILE : test the binary cache of parsed csv files"
+  if os.path.exists(f"{file}.xai"): os.remove(f"{file}.xai")
+  for what in ["parse", "cached"]:
+    t = time.perf_counter(); data = Data(file)
+    print(f"{what:7}", o(msecs=1000*(time.perf_counter() - t)))
+  ref = Data(csv(file))
+  assert data.rows == ref.rows and o(data.cols.all) == o(ref.cols.all)
+  big = f"{file}.big.csv" # ints beyond int64 are cached as symbols
+  with open(big, "w") as f: f.write("A,b,C-\n1,%d,2\n3,%d,4\n" % (2**70, -2**70))
+  for _ in range(2): assert Data(big).rows == Data(csv(big)).rows
+  for x in [big, f"{big}.xai"]: os.remove(x)
+
+def go__sub(file=the.data):
+  "FILE : test removing rows (in any order) undoes adding them"
+  data1 = Data(file)
+  data2 = clone(data1, data1.rows)
+  for row in shuffle(data1.rows[:]): add(data2, row, -1)
+  assert data2.rows == [] and data2._at == {}
+  assert all(col.n == 0 for col in data2.cols.all)
+
+def go__shards(file=the.data):
+  "FILE : test summarizing a csv in parallel shards"
+  data1, data2 = Data(file), shards(file, max(2, the.Procs))
+  assert data1.n == data2.n and not data2.rows
+  for a,b in zip(data1.cols.all, data2.cols.all):
+    assert a.n == b.n and (a.has == b.has if Sym is a.it else
+                           abs(a.mu - b.mu) < 1E-9 and abs(sd(a) - sd(b)) < 1E-6)
+  print(o(n=data2.n, x=[o(mid(col)) for col in data2.cols.x]))
+
 def go__data(file=the.data):
   "FILE : test ading columns from file"
-  data =  Data(csv(file))
+  data =  Data(file)
   total = sum(len(row) for row in data.rows)
   print(*data.cols.names)
   assert Num is data.cols.all[0].it
@@ -262,66 +875,100 @@ def go__data(file=the.data):
 
 def go__clone(file=the.data):
   "FILE : test echoing structure of a table to a new table"
-  data1 =  Data(csv(file))
+  data1 =  Data(file)
   data2 = clone(data1,data1.rows)
   assert data1.cols.x[1].mu == data2.cols.x[1].mu
 
+def go__keep(file=the.data):
+  "FILE : test exact summaries, but only a sample of rows, when streaming"
+  data, some = Data(file), Data(file, keep=50)
+  assert len(some.rows) == 50 and some.n == data.n
+  for c1,c2 in zip(data.cols.all, some.cols.all):
+    assert c1.n == c2.n and (vars(c1) == vars(c2) or abs(c1.mu - c2.mu) < 1e-9)
+  assert len(clone(some, data.rows[:100]).rows) == 100 # clones keep all, by default
+  both = merge(some, clone(some, data.rows[:100]))
+  assert len(both.rows) == 50 and both.n == some.n + 100
+  for row in data.rows: add(some, row, -1)
+  assert some.n == 0 and some.rows == []
+  print(o(rows=len(some.rows), tree=len(Flat(treeGrow(Data(file, 50))).at)))
+
 def go__distx(file=the.data):
   "FILE : show we sort rows by their distance to one row?"
-  data=Data(csv(file))
+  data=Data(file)
   print(*data.cols.names,"distx",sep=",")
   r1 = data.rows[0]
-  data.rows.sort(key=lambda r2: distx(data,r1,r2))
+  ds = distxs(data,r1)
+  data.rows = [data.rows[j] for j in sorted(range(len(ds)), key=ds.__getitem__)]
   for n,r2 in enumerate(data.rows[1:]):
     assert 0 <= distx(data, r1,r2) <= 1
     if n%40==0: print(*r2,o(distx(data,r1,r2)),sep=",")
+  if syms := [c.at for c in data.cols.x if Sym is c.it]: # unseen symbols differ
+    r2, r3 = data.rows[1][:], data.rows[2][:]
+    r2[syms[0]], r3[syms[0]] = "new1", "new2"
+    assert abs(distxs(data, r2, [r3])[0] - distx(data, r2, r3)) < 1E-9
 
 def go__disty(file=the.data):
   "FILE : show we sort rows by their distance to heaven?"
-  data=Data(csv(file))
+  data=Data(file)
   print(*data.cols.names,"disty",sep=",")
-  data.rows.sort(key=lambda r: disty(data,r))
+  ds = distys(data)
+  data.rows = [data.rows[j] for j in sorted(range(len(ds)), key=ds.__getitem__)]
   for n,r1 in enumerate(data.rows):
     if n>0:
       r2=data.rows[n-1]
       assert disty(data, r1) >= disty(data,r2)
     if n%40==0: print(*r1,o(disty(data, r1)),sep=",")
 
+def go__ycache(file=the.data):
+  "FILE : test memoized disty"
+  data = Data(file)
+  ys   = [disty(data,row) for row in data.rows]
+  assert data.misses == 0 and data.hits == len(data.rows)
+  assert ys == [disty(data,row) for row in data.rows]
+  add(data, data.rows[0][:])
+  assert data._ys is None # goal columns changed, so the cache is reset
+  tree = treeGrow(data)
+  print(o(hits=data.hits, misses=data.misses, n=tree.n))
+
+def go__flat(file=the.data):
+  "FILE : test compiled trees predict like treeLeaf"
+  data = Data(file)
+  rows = shuffle(data.rows)
+  tree = treeGrow(clone(data, rows[:100]))
+  f    = Flat(tree)
+  mus  = flatPredict(f, rows)
+  assert mus == [treeLeaf(tree,row).mu for row in rows]
+  assert mus == [f.mu[flatLeaf(f,row)] for row in rows]
+  X = lambda row: treeLeaf(tree,row).mu
+  assert flatTop(f, rows, the.Check) == sorted(rows, key=X)[:the.Check]
+  print(o(nodes=len(f.mu), rows=len(rows)))
+
 def go__bins(file=the.data):
   "FILE : show the rankings of nins"
-  data = Data(csv(file))
-  all_bins = (b for col in data.cols.x for b in cutsRows(col, data.rows, data))
+  data = Data(file)
+  all_bins = (b for col in data.cols.x for b in cutsAll(col, data.rows, data))
   for b in sorted(all_bins, key=lambda b: cutScore(b)):
     print(f"{cutShow(b):20}", o(mu=b.y.mu, sd=sd(b.y), n=b.y.n, 
                                scored= cutScore(b)),sep="\t")
 
 def go__tree(file=the.data, repeats=1):
   "FILE : compare results from all rows vs a tree build from a few rows"
-  data = Data(csv(file))
+  data = Data(file, the.keep)
   b4   = sorted([disty(data,row) for row in data.rows])
   lo   = b4[0]
   mid  = b4[len(b4)//2]
-  Y    = lambda row: disty(data,row)
-  win  = lambda row: int(100*(1- (Y(row) - lo)/ (mid - lo + 1/BIG)))
-  nums = Num()
-  wins = Num()
-  n    = len(data.rows)//2
-  for _ in range(repeats):
-    rows = shuffle(data.rows)
-    test = rows[n:]
-    train= clone(data,rows[:n][:the.Budget-the.Check])
-    uses=set()
-    tree = treeGrow(train,uses=uses)
-    if repeats == 1: treeShow(tree,width=35)
-    X = lambda row: treeLeaf(tree,row).mu
-    guess = min(sorted(test,key=X)[:the.Check],key=Y)
-    if repeats==1:
-      print(o(uses=len(uses), x=len(data.cols.x), y=len(data.cols.y), rows=len(data.rows),
-              lo=lo, mid=mid, guess=Y(guess), win=win(guess)))
-    else:
-      add(nums, Y(guess))
-      add(wins, win(guess))
-  if repeats>1:
+  win  = lambda y: int(100*(1- (y - lo)/ (mid - lo + 1/BIG)))
+  if repeats == 1:
+    guess, tree, uses = trial(data, 0)
+    treeShow(tree,width=35)
+    print(o(uses=len(uses), x=len(data.cols.x), y=len(data.cols.y), 
+            rows=len(data.rows), lo=lo, mid=mid, guess=disty(data,guess), 
+            win=win(disty(data,guess))))
+  else:
+    nums, wins = Num(), Num()
+    for y in trials(data, repeats): # merge, in repeat order
+      add(nums, y)
+      add(wins, win(y))
     print(o(wins=wins.mu, n=nums.n, lo=lo, mid=mid, guess=o(nums.mu)),
          re.sub(r".*/","",file))
     
@@ -374,6 +1021,8 @@ def main(funs,settings):
   for n, s in enumerate(sys.argv):
     arg = coerce(sys.argv[n + 1]) if n < len(sys.argv) - 1 else None
     if fn := funs.get(f"go{s.replace('-', '_')}"):
+      if settings.profile and "_profiled" not in funs: 
+        funs["_profiled"] = profile(funs) # stats, filled in as we go
       fn(arg) if arg is not None else fn()
     elif s=="-h":
       showHelp(funs)